@@ -29,31 +29,87 @@
 import os
 
 class Config:
-    """This is a readonly config-file handler."""
+    """This is a readonly config-file handler. The file is read again whenever
+    it's modified, so one Config object may be shared by the whole program.
+
+    Options after a line like ``[name]'' belong to the section name, the ones
+    before the first section are global. Options not set in a section are
+    taken from the global ones."""
     def __init__(self, fname):
         """__init__(self, string)
 
         fname is the name of the config-file to be read."""
+        self.fname = fname
         self.attrs = {}
+        # section name -> options, the names in the order they appear
+        self.sections = {}
+        self.order = []
+        self.mtime = None
         try:
-            lines = open(fname).read().split('\n')
+            self.__read()
         except:
             open(fname, 'w').close()
             os.chmod(fname, 0600)
-        else:
-            for line in lines:
-                arg = line.split('=', 1)
-                key = arg[0].strip()
-                self.attrs[key] = reduce(str.__add__, arg[1:], '').strip()
-    
-    def get(self, key, default = lambda: None):
-        """get(string, f() -> string|None) -> string|None
+
+    def __read(self):
+        mtime = os.path.getmtime(self.fname)
+        lines = open(self.fname).read().split('\n')
+        self.attrs = {}
+        self.sections = {}
+        self.order = []
+        self.mtime = mtime
+        attrs = self.attrs
+        for line in lines:
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                name = stripped[1:-1].strip()
+                if name not in self.sections:
+                    self.sections[name] = {}
+                    self.order.append(name)
+                attrs = self.sections[name]
+                continue
+            arg = line.split('=', 1)
+            key = arg[0].strip()
+            attrs[key] = reduce(str.__add__, arg[1:], '').strip()
+
+    def __update(self):
+        try:
+            if os.path.getmtime(self.fname) != self.mtime:
+                self.__read()
+        except (IOError, OSError):
+            # the file is gone, the last values read are as good as any
+            pass
+
+    def get(self, key, default = lambda: None, section = None):
+        """get(string, f() -> string|None, string|None) -> string|None
 
         This method was created allowing for lazy evaluation, you should pass a
         function as a parameter which, when evaluated will return the default
         value. This allow for very small code for when we want to read user
-        input as a default."""
+        input as a default. If a section is given, its options come before
+        the global ones."""
+        self.__update()
+        if section is not None and self.sections.get(section, {}).has_key(key):
+            return self.sections[section][key]
         if self.attrs.has_key(key):
             return self.attrs[key]
         else:
             return default()
+
+    def section_names(self):
+        """section_names(self) -> [string]
+
+        Returns the names of the sections, in the order they appear."""
+        self.__update()
+        return list(self.order)
+
+    def has(self, key, section = None):
+        """has(self, string, string|None) -> bool
+
+        Returns whether the option is set in the section, or in the global
+        options if section is None. The global options aren't looked at when a
+        section is given."""
+        self.__update()
+        if section is None:
+            return self.attrs.has_key(key)
+        return self.sections.get(section, {}).has_key(key)
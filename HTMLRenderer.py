@@ -0,0 +1,221 @@
+"""Converts HTML e-mails into plain text."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import re
+import textwrap
+import HTMLParser
+
+from htmlentitydefs import name2codepoint
+
+# Width of the rendered text
+WIDTH = 79
+
+# Tags which start a new paragraph
+_BLOCKS = set(['p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol',
+               'li', 'dl', 'dt', 'dd', 'table', 'tr', 'blockquote', 'pre',
+               'address', 'center', 'form', 'hr', 'body'])
+# Tags whose contents are never shown
+_HIDDEN = set(['head', 'script', 'style', 'title'])
+
+_SPACES = re.compile(r'\s+', re.UNICODE)
+
+class HTMLRenderer(HTMLParser.HTMLParser):
+    """An HTML parser that renders the document it's fed as plain text.
+
+    Each paragraph is wrapped and moved to the lines attribute as soon as the
+    tag ending it is seen, so the document may be fed in pieces. Once close()
+    is called the text() method returns the whole rendered document."""
+
+    def __init__(self, width=WIDTH):
+        HTMLParser.HTMLParser.__init__(self)
+        self.width = width
+        self.lines = []
+        # words of the paragraph being read
+        self.words = []
+        # whether the text read last ended with a space
+        self.space = True
+        self.hidden = 0
+        self.pre = 0
+        self.quote = 0
+        # one entry per open list, None for <ul> and the item number for <ol>
+        self.lists = []
+        self.bullet = ''
+        self.href = None
+
+    def __prefix(self):
+        return '> ' * self.quote + '   ' * max(len(self.lists) - 1, 0)
+
+    def __flush(self):
+        """Wraps the words read so far as a paragraph."""
+        prefix = self.__prefix()
+        if self.pre:
+            text = ''.join(self.words)
+            self.words = []
+            if text.startswith('\n'):
+                text = text[1:]
+            for line in text.rstrip().split('\n'):
+                self.lines.append(prefix + line.rstrip())
+            return
+        text = ' '.join(self.words)
+        self.words = []
+        self.space = True
+        if not text and not self.bullet:
+            return
+        first = prefix + self.bullet
+        rest = prefix + ' ' * len(self.bullet)
+        self.bullet = ''
+        self.lines.extend(textwrap.wrap(text, self.width,
+                                        initial_indent=first,
+                                        subsequent_indent=rest,
+                                        break_long_words=False) or [first])
+
+    def __blank(self):
+        """Ends the current paragraph leaving an empty line after it."""
+        self.__flush()
+        blank = ('> ' * self.quote).rstrip()
+        if not self.lines:
+            return
+        if self.lines[-1].strip('> '):
+            self.lines.append(blank)
+        elif len(blank) < len(self.lines[-1]):
+            # leaving a quote, the empty line shouldn't be quoted
+            self.lines[-1] = blank
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _HIDDEN:
+            self.hidden += 1
+            return
+        attrs = dict(attrs)
+        if tag == 'br':
+            self.__flush()
+        elif tag == 'hr':
+            self.__blank()
+            self.lines.append(self.__prefix() + '-' * (self.width -
+                                                       len(self.__prefix())))
+            self.__blank()
+        elif tag == 'img' and attrs.get('alt'):
+            self.handle_data('[%s]' % attrs['alt'])
+        elif tag == 'a':
+            self.href = attrs.get('href')
+        elif tag == 'li':
+            self.__flush()
+            if self.lists and self.lists[-1] is not None:
+                self.lists[-1] += 1
+                self.bullet = '%d. ' % self.lists[-1]
+            else:
+                self.bullet = '* '
+        elif tag in _BLOCKS:
+            self.__blank()
+            if tag == 'blockquote':
+                self.quote += 1
+            elif tag == 'pre':
+                self.pre += 1
+            elif tag == 'ul':
+                self.lists.append(None)
+            elif tag == 'ol':
+                self.lists.append(0)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in ('br', 'hr', 'img'):
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in _HIDDEN:
+            self.hidden = max(self.hidden - 1, 0)
+        elif tag == 'a':
+            # show where the link goes, unless the text already tells that
+            if self.href and '://' in self.href and self.words and\
+               self.href not in self.words[-1]:
+                self.words.append('<%s>' % self.href)
+                self.space = True
+            self.href = None
+        elif tag in ('td', 'th'):
+            self.space = True
+        elif tag == 'li':
+            self.__flush()
+        elif tag in _BLOCKS:
+            self.__flush()
+            if tag == 'blockquote':
+                self.quote = max(self.quote - 1, 0)
+            elif tag == 'pre':
+                self.pre = max(self.pre - 1, 0)
+            elif tag in ('ul', 'ol') and self.lists:
+                self.lists.pop()
+            self.__blank()
+
+    def handle_data(self, data):
+        if self.hidden:
+            return
+        if self.pre:
+            self.words.append(data)
+            return
+        words = _SPACES.split(data)
+        # the text may continue a word split by a tag, as in <b>w</b>ord
+        if self.words and not self.space and words[0]:
+            self.words[-1] += words.pop(0)
+        self.words.extend([x for x in words if x])
+        if words:
+            self.space = not words[-1]
+
+    def handle_entityref(self, name):
+        if name in name2codepoint:
+            self.handle_data(unichr(name2codepoint[name]))
+        else:
+            self.handle_data(u'&%s;' % name)
+
+    def handle_charref(self, name):
+        try:
+            if name[0] in 'xX':
+                c = unichr(int(name[1:], 16))
+            else:
+                c = unichr(int(name))
+        except (ValueError, OverflowError):
+            c = u'&#%s;' % name
+        self.handle_data(c)
+
+    def close(self):
+        HTMLParser.HTMLParser.close(self)
+        self.__flush()
+
+    def text(self):
+        """text(self) -> unicode
+
+        Returns the text rendered so far."""
+        return '\n'.join(self.lines).strip('\n') + '\n'
+
+
+def html_to_text(html):
+    """html_to_text(unicode) -> unicode
+
+    Renders the HTML document passed as parameter as plain text. It raises
+    HTMLParser.HTMLParseError if the document is too broken to be read."""
+    r = HTMLRenderer()
+    r.feed(html)
+    r.close()
+    return r.text()
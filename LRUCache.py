@@ -0,0 +1,126 @@
+"""A dictionary with bounded size that forgets the entries least used."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+
+# positions inside each entry of the linked list
+_PREV, _NEXT, _KEY, _VALUE, _SIZE = range(5)
+
+class LRUCache:
+    """A bounded cache. When it grows bigger than its maximum size the entries
+    that were used the longest time ago are thrown away.
+
+    The size of the cache is the number of entries it has, unless a sizeof
+    function is given, in which case it's the sum of sizeof(value) for every
+    value stored. It's safe to use the cache from several threads."""
+
+    def __init__(self, maxsize, sizeof=None):
+        """__init__(self, int, f(object) -> int)
+
+        maxsize is the biggest size the cache may have and sizeof is the
+        function measuring each value stored (every value has size 1 if it's
+        not given)."""
+        self.maxsize = maxsize
+        self.sizeof = sizeof or (lambda x: 1)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.entries = {}
+        # circular doubly linked list, ordered from the least recently used
+        # entry to the most recently used one
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None, 0]
+
+    def __unlink(self, entry):
+        entry[_PREV][_NEXT] = entry[_NEXT]
+        entry[_NEXT][_PREV] = entry[_PREV]
+
+    def __append(self, entry):
+        last = self.root[_PREV]
+        entry[_PREV] = last
+        entry[_NEXT] = self.root
+        last[_NEXT] = entry
+        self.root[_PREV] = entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """get(self, object, object) -> object
+
+        Returns the value stored for key, or default if there's none."""
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            self.__unlink(entry)
+            self.__append(entry)
+            return entry[_VALUE]
+        finally:
+            self.lock.release()
+
+    def put(self, key, value):
+        """put(self, object, object) -> None
+
+        Stores value for key, throwing away old entries if needed. A value
+        bigger than the whole cache isn't stored at all."""
+        size = self.sizeof(value)
+        self.lock.acquire()
+        try:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.__unlink(old)
+                self.size -= old[_SIZE]
+            if size > self.maxsize:
+                return
+            entry = [None, None, key, value, size]
+            self.__append(entry)
+            self.entries[key] = entry
+            self.size += size
+            while self.size > self.maxsize:
+                first = self.root[_NEXT]
+                self.__unlink(first)
+                del self.entries[first[_KEY]]
+                self.size -= first[_SIZE]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        """clear(self) -> None
+
+        Throws away every entry."""
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.root[:] = [self.root, self.root, None, None, 0]
+            self.size = 0
+        finally:
+            self.lock.release()
@@ -0,0 +1,77 @@
+"""Keeps the label names between runs."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import time
+
+class LabelCache:
+    """Remembers the label names of an account in a file, so they don't have
+    to be asked to gmail each time they're needed. The names are asked again
+    once they're older than ``ttl'' seconds, or when a refresh is forced."""
+
+    def __init__(self, fname, ttl, fetch):
+        """__init__(self, string, float, f() -> [string])
+
+        fname is the file where the labels are kept and fetch is the function
+        asking gmail for them."""
+        self.fname = fname
+        self.ttl = ttl
+        self.fetch = fetch
+        self.labels = None
+        self.time = 0
+        self.__load()
+
+    def __load(self):
+        try:
+            lines = open(self.fname).read().split('\n')
+            self.time = float(lines[0])
+        except (IOError, ValueError):
+            return
+        self.labels = [x for x in lines[1:] if x]
+
+    def __save(self):
+        try:
+            f = open(self.fname, 'w')
+            f.write('%f\n' % self.time)
+            for label in self.labels:
+                f.write(label + '\n')
+            f.close()
+        except IOError:
+            # we still have them in memory
+            pass
+
+    def get(self, refresh=False):
+        """get(self, bool) -> [string]
+
+        Returns the label names, asking gmail for them when they're too old,
+        were never asked before or refresh is True."""
+        if refresh or self.labels is None or\
+           time.time() - self.time > self.ttl:
+            self.labels = list(self.fetch() or [])
+            self.time = time.time()
+            self.__save()
+        return self.labels
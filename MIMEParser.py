@@ -25,11 +25,273 @@
 # IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
-import email
+import re
+import binascii
 import subprocess
+import HTMLParser
 
-def _get_body(msg):
-    """_get_body(Message) -> string
+from cStringIO import StringIO
+try:
+    from email.feedparser import FeedParser
+    from email.message import Message
+    from email.parser import HeaderParser
+except ImportError:
+    # python 2.4 names the email modules differently
+    from email.FeedParser import FeedParser
+    from email.Message import Message
+    from email.Parser import HeaderParser
+
+import stats
+from HTMLRenderer import html_to_text
+
+# How much of the source is fed to the parser at a time
+CHUNK = 64 * 1024
+
+_headers = HeaderParser()
+
+# added by _strip to the headers of the parts whose body it leaves out, with
+# the number of the part
+_PART = 'X-Gmailreader-Part'
+
+_TAGS = re.compile(r'<[^>]*>')
+
+class _LeanMessage(Message):
+    """A Message that throws away the payload of the parts we never show, like
+    attachments and images. Only the size of the payload is kept, as the
+    ``dropped'' attribute."""
+
+    dropped = 0
+
+    def set_payload(self, payload, charset=None):
+        if isinstance(payload, basestring) and payload and\
+           self.get_content_maintype() not in ('text', 'multipart', 'message'):
+            self.dropped = len(payload)
+            payload = ''
+        Message.set_payload(self, payload, charset)
+
+def _strip(text, dropped, skipped=None):
+    """_strip(string, {int: int}, f(int, string) -> None) -> iter(string)
+
+    Generates the lines of the e-mail source text, except the ones in the body
+    of parts that aren't text, multipart or message. The size of each body
+    left out is stored in dropped, by the number of its part (the parts are
+    numbered in the order they appear, starting at 0), and the number is
+    added to the part's headers as _PART. Each line left out is passed to
+    skipped, with the number of its part, if it's given."""
+    # boundaries of the multipart parts we're inside
+    boundaries = []
+    # header lines of the current part, None once we're past them
+    headers = []
+    part = 0
+    skipping = False
+    for line in StringIO(text):
+        if boundaries and line.startswith('--'):
+            mark = line.rstrip()
+            for i in xrange(len(boundaries) - 1, -1, -1):
+                if mark == '--' + boundaries[i]:
+                    # a new part of the multipart starts
+                    del boundaries[i+1:]
+                    headers = []
+                    part += 1
+                    break
+                elif mark == '--' + boundaries[i] + '--':
+                    # back to the epilogue of the multipart
+                    del boundaries[i:]
+                    headers = None
+                    break
+            else:
+                i = None
+            if i is not None:
+                skipping = False
+                yield line
+                continue
+
+        if skipping:
+            dropped[part] += len(line)
+            if skipped is not None:
+                skipped(part, line)
+            continue
+        if headers is None:
+            yield line
+            continue
+
+        headers.append(line)
+        if line.strip():
+            yield line
+            continue
+        msg = _headers.parsestr(''.join(headers))
+        headers = None
+        maintype = msg.get_content_maintype()
+        if maintype == 'multipart':
+            if msg.get_boundary():
+                boundaries.append(msg.get_boundary())
+        elif maintype == 'message':
+            # the parser reads message/* as an enclosed message, except
+            # delivery-status, which is just blocks of headers kept as text
+            if msg.get_content_type() != 'message/delivery-status':
+                headers = []
+                part += 1
+        elif maintype != 'text':
+            skipping = True
+            dropped[part] = 0
+            yield '%s: %d\n' % (_PART, part)
+        yield line
+
+def parse(text):
+    """parse(string) -> Message
+
+    Parses the e-mail source text feeding it to the parser a piece at a time.
+    The body of the parts that aren't text never reaches the parser, so the
+    parsed message takes about as much memory as its text does."""
+    created = []
+    def factory():
+        msg = _LeanMessage()
+        created.append(msg)
+        return msg
+
+    dropped = {}
+    p = FeedParser(_factory=factory)
+    chunk = []
+    size = 0
+    for line in _strip(text, dropped):
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK:
+            p.feed(''.join(chunk))
+            chunk = []
+            size = 0
+    p.feed(''.join(chunk))
+    msg = p.close()
+
+    # the parts left without a body carry the number _strip gave them
+    for part in created:
+        number = part.get(_PART)
+        del part[_PART]
+        try:
+            part.number = int(number)
+        except (TypeError, ValueError):
+            continue
+        part.dropped = dropped.get(part.number, 0)
+    return msg
+
+def attachments(msg):
+    """attachments(Message) -> [Message]
+
+    Returns the parts of msg, as returned by parse, that are attachments: the
+    ones that have a file name or whose payload was dropped by the parser.
+    They come in the order they appear, so parsing the same source again
+    gives each one the same position."""
+    return [part for (part, ctype, depth, forwarded) in _index(msg)
+            if not part.is_multipart() and ctype != 'message/rfc822' and
+               (part.get_filename() or getattr(part, 'dropped', 0))]
+
+class _Decoder:
+    """Decodes the lines of a part's body as they come, writing them to a
+    file. Only a chunk of the body is kept in memory at a time."""
+
+    def __init__(self, encoding, out):
+        self.encoding = encoding
+        self.out = out
+        self.chunk = []
+        self.size = 0
+        # the line break before a boundary belongs to the boundary
+        self.last = ''
+
+    def feed(self, line):
+        if self.encoding == 'base64':
+            self.chunk.append(line.strip())
+        else:
+            self.chunk.append(self.last)
+            self.last = line
+        self.size += len(line)
+        if self.size >= CHUNK:
+            self.flush()
+
+    def flush(self):
+        data = ''.join(self.chunk)
+        self.chunk = []
+        self.size = 0
+        if self.encoding == 'base64':
+            # base64 is decoded 4 characters at a time, what's left waits
+            # for the next chunk
+            whole = len(data) - len(data) % 4
+            if whole < len(data):
+                self.chunk.append(data[whole:])
+                self.size = len(data) - whole
+            self.out.write(binascii.a2b_base64(data[:whole]))
+        else:
+            self.out.write(self.__decode(data))
+
+    def __decode(self, data):
+        if self.encoding == 'quoted-printable':
+            # soft line breaks never go past the end of a line, so any
+            # sequence of whole lines can be decoded
+            return binascii.a2b_qp(data)
+        return data
+
+    def close(self):
+        if self.encoding == 'base64':
+            data = ''.join(self.chunk)
+            # a partial group at the very end is padded
+            if len(data) % 4:
+                data += '=' * (4 - len(data) % 4)
+            self.out.write(binascii.a2b_base64(data))
+        else:
+            self.flush()
+            last = self.last
+            if last.endswith('\r\n'):
+                last = last[:-2]
+            elif last.endswith('\n'):
+                last = last[:-1]
+            self.out.write(self.__decode(last))
+
+def save(text, part, out):
+    """save(string, Message, file) -> None
+
+    Writes the decoded payload of part, a part of the message parse(text)
+    returned, to out. A payload the parser dropped is decoded straight from
+    text, a chunk at a time."""
+    if not getattr(part, 'dropped', 0):
+        out.write(part.get_payload(decode=True) or '')
+        return
+
+    encoding = part.get('content-transfer-encoding', '').strip().lower()
+    decoder = _Decoder(encoding, out)
+    def skipped(number, line):
+        if number == part.number:
+            decoder.feed(line)
+    for line in _strip(text, {}, skipped):
+        pass
+    decoder.close()
+
+def _render_html(body, command=None):
+    """_render_html(string, string|None) -> string
+
+    Converts the html document body into utf-8 text. It's done by
+    HTMLRenderer unless the document is too broken for it to read. When that
+    happens the command passed as parameter is used, if any, and the html tags
+    are just removed otherwise."""
+
+    try:
+        html = body.decode('utf-8')
+    except UnicodeDecodeError:
+        # not even its charset was right, iso8859-1 at least shows something
+        html = body.decode('iso8859-1')
+    try:
+        return stats.stage('html', html_to_text, html).encode('utf-8')
+    except HTMLParser.HTMLParseError:
+        pass
+    if command:
+        p = subprocess.Popen(command, shell=True,
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE)
+        (text, err) = stats.stage('html2text', p.communicate,
+                                  html.encode('utf-8'))
+        return text
+    return _TAGS.sub('', html).encode('utf-8')
+
+def _get_body(msg, html_command=None):
+    """_get_body(Message, string|None) -> string
 
     This function decodes the message passed by parameter and converts it from
     html to text if needed."""
@@ -42,78 +304,52 @@ def _get_body(msg):
         except UnicodeDecodeError:
             pass
     if msg.get_content_type() == 'text/html':
-        p = subprocess.Popen(['html2text', '-nobs'],
-                             stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE)
-        # XXX: html2text expects iso8859-1 input and returns that to output. I'd
-        # like to work with a command that understands utf-8
-        try:
-            tmp = body.decode('utf-8').encode('iso8859-1')
-        except UnicodeDecodeError:
-            # ops, it wasn't utf-8
-            tmp = body
-        except UnicodeEncodeError:
-            tmp = body
-        (body, err) = p.communicate(tmp)
-        body = body.decode('iso8859-1').encode('utf-8')
+        body = _render_html(body, html_command)
 
     return body.replace('\r', '')
 
-def _scan_type(msg, t):
-    """_scan_type(Message, string) -> [Message]
-
-    Creates a list with all the messages of the type t on the msg tree passed as
-    a parameter."""
-
-    if msg.is_multipart():
-        msgs = []
-        if msg.get_content_type() == t:
-            msgs.append(msg)
-        parts = msg.get_payload()
-        for m in parts:
-            if m.get_content_type() == t:
-                msgs.append(m)
-            msgs.extend(_scan_type(m, t))
-        return msgs
-    else:
-        if msg.get_content_type() == t:
-            return [msg]
-        else:
-            return []
-
-def _parse_multipart(multimsg):
-    """_parse_muiltipart(Message) -> (body : Message, forward : Message)
-
-    This function returns the body part of the MIME message passed as parameter
-    and the forward section (message/rfc822) of it."""
-
-    forwards = _scan_type(multimsg, 'message/rfc822')
-    forwards_html = []
-    forwards_plain = []
-    for f in forwards:
-        forwards_html.extend(_scan_type(f, 'text/html'))
-        forwards_plain.extend(_scan_type(f, 'text/plain'))
-
-    html = [x for x in _scan_type(multimsg, 'text/html')\
-              if x not in forwards_html]
-    plain = [x for x in _scan_type(multimsg, 'text/plain')\
-               if x not in forwards_html]
-
-    if forwards_html:
-        forwards = forwards_html[0]
-    elif forwards_plain:
-        forwards = forwards_plain[0]
-    else:
-        forwards = None
-
-    if html:
-        text = html[0]
-    elif plain:
-        text = plain[0]
-    else:
-        text = None
-
-    return (text, forwards)
+def _index(msg):
+    """_index(Message) -> [(Message, string, int, bool)]
+
+    Walks the msg tree once, listing each part in the order they appear on the
+    message as (part, content type, depth, forwarded). forwarded tells whether
+    the part is inside a message/rfc822 part."""
+
+    parts = []
+    stack = [(msg, 0, False)]
+    while stack:
+        (part, depth, forwarded) = stack.pop()
+        ctype = part.get_content_type()
+        parts.append((part, ctype, depth, forwarded))
+        if part.is_multipart():
+            inside = forwarded or ctype == 'message/rfc822'
+            children = part.get_payload()
+            for i in xrange(len(children) - 1, -1, -1):
+                stack.append((children[i], depth + 1, inside))
+    return parts
+
+def _parse_multipart(parts):
+    """_parse_muiltipart([(Message, string, int, bool)]) -> (body : Message,
+                                                             forward : Message)
+
+    This function returns the body part of the MIME message indexed by
+    parts and the forward section (message/rfc822) of it."""
+
+    # the first part of each (content type, forwarded) pair
+    first = {}
+    for (part, ctype, depth, forwarded) in parts:
+        if (ctype, forwarded) not in first:
+            first[(ctype, forwarded)] = part
+
+    def find(*keys):
+        for key in keys:
+            if key in first:
+                return first[key]
+        return None
+
+    text = find(('text/html', False), ('text/plain', False))
+    forward = find(('text/html', True), ('text/plain', True))
+    return (text, forward)
 
 class MIMEParser:
     """Parses a multipart message and extracts the body of the message and the
@@ -121,23 +357,33 @@ class MIMEParser:
 
     The ``body'' object attribute contains a string with the body of the e-mail
     (the text that's contained on it) and the attribute ``forward'' contains the
-    text being forwarded (message/rfc822)"""
+    text being forwarded (message/rfc822). The parsed message itself, where the
+    headers can be read from, is the ``message'' attribute."""
 
-    def __init__(self, text):
-        """__init__(self, string)
+    def __init__(self, msg, html_command=None):
+        """__init__(self, string|Message, string|None)
 
-        text is the e-mail message we want to parse."""
-        msg = email.message_from_string(text)
+        msg is the e-mail message we want to parse, either its source or the
+        Message object it was already parsed into. html_command is a shell
+        command that converts html into text, only used for the html parts
+        too broken to be rendered by HTMLRenderer."""
+        if isinstance(msg, basestring):
+            msg = stats.stage('mime parse', parse, msg)
+        self.message = msg
+        # (part, content type, depth, forwarded) for each part of msg
+        self.parts = stats.stage('mime index', _index, msg)
         if msg.is_multipart():
-            (payload, forward) = _parse_multipart(msg)
-            if payload:
-                self.body = _get_body(payload)
+            (payload, forward) = _parse_multipart(self.parts)
+            if payload is not None:
+                self.body = stats.stage('mime body', _get_body, payload,
+                                        html_command)
             else:
                 self.body = ''
-            if forward:
-                self.forward = _get_body(forward)
+            if forward is not None:
+                self.forward = stats.stage('mime body', _get_body, forward,
+                                           html_command)
             else:
                 self.forward = ''
         else:
-            self.body = _get_body(msg)
+            self.body = stats.stage('mime body', _get_body, msg, html_command)
             self.forward = ''
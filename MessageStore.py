@@ -0,0 +1,141 @@
+"""A local store for the raw source of the messages."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import thread
+import threading
+import zlib
+
+from lazy import LazyModule
+
+# only needed once a message is read or stored
+urllib = LazyModule('urllib')
+
+class MessageStore:
+    """Keeps the raw source of the messages on disk, one zlib-compressed file
+    per message id, so each message has to be downloaded only once.
+
+    The store is bounded by size: whenever it grows larger than ``maxsize''
+    bytes the messages that were read the longest time ago are removed."""
+
+    def __init__(self, path, maxsize):
+        """__init__(self, string, int)
+
+        path is the directory where the messages are kept and maxsize is how
+        many bytes the store may use on disk. A maxsize of 0 disables the
+        store."""
+        self.path = path
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        # bytes used on disk, only computed on the first put()
+        self.size = None
+        if not os.path.isdir(path):
+            os.makedirs(path, 0700)
+
+    def __fname(self, msgid):
+        return os.path.join(self.path, urllib.quote(msgid, ''))
+
+    def __entries(self):
+        """__entries(self) -> [(float, int, string)]
+
+        Lists the (last access, size, file name) of every stored message."""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.tmp'):
+                continue
+            fname = os.path.join(self.path, name)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                # removed by another gmailreader
+                continue
+            entries.append((st.st_mtime, st.st_size, fname))
+        return entries
+
+    def __evict(self):
+        entries = self.__entries()
+        entries.sort()
+        self.size = sum([x[1] for x in entries])
+        for mtime, size, fname in entries:
+            if self.size <= self.maxsize:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            self.size -= size
+
+    def __contains__(self, msgid):
+        return os.path.isfile(self.__fname(msgid))
+
+    def get(self, msgid):
+        """get(self, string) -> string|None
+
+        Returns the source of the message identified by msgid or None if it
+        isn't in the store."""
+        fname = self.__fname(msgid)
+        try:
+            data = open(fname, 'rb').read()
+            # the modification time tells which messages were used recently
+            os.utime(fname, None)
+            return zlib.decompress(data)
+        except (IOError, OSError, zlib.error):
+            return None
+
+    def put(self, msgid, source):
+        """put(self, string, string) -> None
+
+        Stores the source of the message identified by msgid, removing old
+        messages if the store gets too big."""
+        if self.maxsize <= 0:
+            return
+        data = zlib.compress(source)
+        fname = self.__fname(msgid)
+        tmp = '%s.%d.%d.tmp' % (fname, os.getpid(), thread.get_ident())
+        self.lock.acquire()
+        try:
+            if self.size is None:
+                self.size = sum([x[1] for x in self.__entries()])
+            try:
+                f = open(tmp, 'wb')
+                f.write(data)
+                f.close()
+                if os.path.isfile(fname):
+                    self.size -= os.path.getsize(fname)
+                # rename is atomic, readers never see half written messages
+                os.rename(tmp, fname)
+            except (IOError, OSError):
+                # not being able to store a message is no reason to stop
+                # reading it
+                return
+            self.size += len(data)
+            if self.size > self.maxsize:
+                self.__evict()
+        finally:
+            self.lock.release()
@@ -0,0 +1,203 @@
+"""A spool of the e-mails waiting to be sent."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import time
+import fcntl
+import threading
+
+class Outbox:
+    """A directory with the e-mails waiting to be sent, one per file, and the
+    thread that sends them. When sending fails it's tried again later, each
+    time waiting twice as long as before.
+
+    Only one process sends the e-mails of a directory at a time, they're
+    left there until gmail accepts them, so the ones not sent before
+    gmailreader exits are sent the next time it runs."""
+    # seconds waited before trying to send an e-mail again
+    MIN_DELAY = 30
+    MAX_DELAY = 30 * 60
+
+    def __init__(self, path, send):
+        """__init__(self, string, f(string) -> None)
+
+        path is the directory of the e-mails and send is the function that
+        sends the text of an e-mail, raising an exception if it fails."""
+        self.path = path
+        self.send = send
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        # file name -> (failed attempts, last error, when to try again)
+        self.failures = {}
+        self.sending = None
+        self.count = 0
+
+    def __names(self):
+        names = [x for x in os.listdir(self.path) if not x.startswith('.')]
+        names.sort()
+        return names
+
+    def put(self, text):
+        """put(self, string) -> string
+
+        Adds the e-mail to the outbox and wakes the sender up. Returns the
+        name of the file the e-mail was saved in."""
+        self.lock.acquire()
+        try:
+            self.count += 1
+            # the names sort by the time they were queued
+            name = '%017.6f.%d.%d' % (time.time(), os.getpid(), self.count)
+        finally:
+            self.lock.release()
+        tmp = os.path.join(self.path, '.' + name)
+        f = open(tmp, 'w')
+        try:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(tmp, os.path.join(self.path, name))
+        self.start()
+        self.wakeup.set()
+        return name
+
+    def entries(self):
+        """entries(self) -> [(string, string, string|None)]
+
+        Returns the e-mails waiting to be sent, oldest first, as the text of
+        the e-mail, its file name and what happened to it so far."""
+        result = []
+        for name in self.__names():
+            try:
+                text = open(os.path.join(self.path, name)).read()
+            except IOError:
+                # sent while we were listing
+                continue
+            self.lock.acquire()
+            try:
+                if name == self.sending:
+                    status = 'sending'
+                elif name in self.failures:
+                    (attempts, error, when) = self.failures[name]
+                    status = 'failed %d times (%s), trying again in %ds' %\
+                             (attempts, error, max(0, when - time.time()))
+                else:
+                    status = None
+            finally:
+                self.lock.release()
+            result.append((text, name, status))
+        return result
+
+    def retry(self):
+        """retry(self) -> None
+
+        Makes the sender try every e-mail again now."""
+        self.lock.acquire()
+        try:
+            for name, (attempts, error, when) in self.failures.items():
+                self.failures[name] = (attempts, error, 0)
+        finally:
+            self.lock.release()
+        self.start()
+        self.wakeup.set()
+
+    def start(self):
+        """start(self) -> None
+
+        Starts the sender, if it isn't running yet."""
+        self.lock.acquire()
+        try:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__run)
+                self.thread.setDaemon(True)
+                self.thread.start()
+        finally:
+            self.lock.release()
+
+    def __run(self):
+        while 1:
+            self.wakeup.clear()
+            delay = self.__deliver()
+            self.wakeup.wait(delay)
+
+    def __deliver(self):
+        """__deliver(self) -> float
+
+        Sends every e-mail that is due, returning how long to wait before
+        trying again."""
+        lockfile = open(os.path.join(self.path, '.lock'), 'w')
+        try:
+            try:
+                fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                # another gmailreader is sending them
+                return self.MIN_DELAY
+
+            delay = self.MAX_DELAY
+            for name in self.__names():
+                fname = os.path.join(self.path, name)
+                (attempts, error, when) = self.failures.get(name,
+                                                            (0, None, 0))
+                if when > time.time():
+                    delay = min(delay, when - time.time())
+                    continue
+                try:
+                    text = open(fname).read()
+                except IOError:
+                    continue
+
+                self.sending = name
+                try:
+                    self.send(text)
+                except Exception, e:
+                    attempts += 1
+                    wait = min(self.MIN_DELAY * 2 ** (attempts - 1),
+                               self.MAX_DELAY)
+                    self.lock.acquire()
+                    try:
+                        self.failures[name] = (attempts,
+                                               str(e) or e.__class__.__name__,
+                                               time.time() + wait)
+                    finally:
+                        self.lock.release()
+                    delay = min(delay, wait)
+                else:
+                    os.remove(fname)
+                    self.lock.acquire()
+                    try:
+                        self.failures.pop(name, None)
+                    finally:
+                        self.lock.release()
+                self.sending = None
+            return delay
+        finally:
+            lockfile.close()
@@ -0,0 +1,117 @@
+"""Watches folders for new e-mail."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import time
+
+from workers import pmap
+
+class Poller:
+    """Polls a set of folders, each one on its own schedule, and tells which
+    threads became unread since the last time they were seen.
+
+    A folder where nothing happens is polled less and less often, from
+    ``mininterval'' up to ``maxinterval'' seconds, and goes back to being
+    polled every ``mininterval'' seconds as soon as new e-mail arrives in it.
+    If polling a folder fails, it's tried again after a delay that doubles
+    with each failure in a row."""
+
+    # how much the interval grows each time nothing new is found
+    GROWTH = 1.5
+
+    def __init__(self, fetch, folders, errors=(), mininterval=10,
+                 maxinterval=300, nthreads=1):
+        """__init__(self, f(object) -> [GmailThread], [object], (class),
+                    float, float, int)
+
+        fetch is the function returning the threads of a folder, it's called
+        with the folders listed in the folders parameter. The exceptions in
+        errors are the ones that make polling back off, any other one is
+        raised. Up to nthreads folders are fetched at the same time."""
+        self.fetch = fetch
+        self.folders = list(folders)
+        self.errors = errors
+        self.mininterval = mininterval
+        self.maxinterval = maxinterval
+        self.nthreads = nthreads
+        now = time.time()
+        self.interval = dict([(f, mininterval) for f in self.folders])
+        self.due = dict([(f, now) for f in self.folders])
+        self.failures = dict([(f, 0) for f in self.folders])
+        # folder -> {thread id: unread}, for the folders polled at least once
+        self.snapshot = {}
+
+    def delay(self):
+        """delay(self) -> float
+
+        Returns how many seconds until the next folder should be polled."""
+        return max(min(self.due.values()) - time.time(), 0)
+
+    def __fetch(self, folder):
+        try:
+            return list(self.fetch(folder))
+        except self.errors:
+            return None
+
+    def poll(self):
+        """poll(self) -> {object: [GmailThread]}
+
+        Polls the folders that are due, returning the threads that became
+        unread in each folder where there are some. The first poll of a folder
+        only records its state, nothing in it is reported as new."""
+        now = time.time()
+        due = [f for f in self.folders if self.due[f] <= now]
+        results = pmap(self.__fetch, due, self.nthreads)
+
+        now = time.time()
+        changed = {}
+        for folder, threads in zip(due, results):
+            if threads is None:
+                self.failures[folder] += 1
+                self.due[folder] = now + min(self.mininterval *
+                                             2 ** self.failures[folder],
+                                             self.maxinterval)
+                continue
+            self.failures[folder] = 0
+
+            old = self.snapshot.get(folder)
+            self.snapshot[folder] = dict([(t.id, bool(t.unread))
+                                          for t in threads])
+            if old is not None:
+                new = [t for t in threads if t.unread and not old.get(t.id)]
+            else:
+                new = []
+
+            if new:
+                changed[folder] = new
+                self.interval[folder] = self.mininterval
+            else:
+                self.interval[folder] = min(self.interval[folder] *
+                                            self.GROWTH, self.maxinterval)
+            self.due[folder] = now + self.interval[folder]
+
+        return changed
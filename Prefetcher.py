@@ -0,0 +1,100 @@
+"""Does work in the background before the user asks for it."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+
+class Prefetcher:
+    """Calls a function for each of a list of items, one at a time, in a
+    thread of its own. It's meant for work that is only done in advance, so
+    the exceptions raised are ignored: they'll be raised again when the work
+    is really needed."""
+
+    # the prefetchers whose thread is running, even if cancelled
+    running = []
+    lock = threading.Lock()
+
+    def __init__(self, f, items):
+        """__init__(self, f(x) -> object, [x])
+
+        f is called for the items, in their order, once start() is called."""
+        self.f = f
+        self.items = list(items)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.__run)
+        self.thread.setDaemon(True)
+
+    def start(self):
+        """start(self) -> None"""
+        self.thread.start()
+
+    def __run(self):
+        Prefetcher.lock.acquire()
+        try:
+            Prefetcher.running.append(self)
+        finally:
+            Prefetcher.lock.release()
+        try:
+            for x in self.items:
+                if self.stop.isSet():
+                    return
+                try:
+                    self.f(x)
+                except Exception:
+                    pass
+        finally:
+            Prefetcher.lock.acquire()
+            try:
+                Prefetcher.running.remove(self)
+            finally:
+                Prefetcher.lock.release()
+
+    def cancel(self):
+        """cancel(self) -> None
+
+        Stops before the next item. The one being worked on is finished."""
+        self.stop.set()
+
+    def cancelled(self):
+        """cancelled(self) -> bool"""
+        return self.stop.isSet()
+
+    @classmethod
+    def cancel_all(cls, timeout=None):
+        """cancel_all(timeout) -> None
+
+        Cancels every prefetcher running and waits, up to timeout seconds
+        for each, for the items being worked on."""
+        cls.lock.acquire()
+        try:
+            running = list(cls.running)
+        finally:
+            cls.lock.release()
+        for prefetcher in running:
+            prefetcher.cancel()
+        for prefetcher in running:
+            prefetcher.thread.join(timeout)
@@ -0,0 +1,273 @@
+"""A local full-text index of the e-mails seen."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import re
+import fcntl
+import shelve
+import anydbm
+import threading
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+
+def _terms(text):
+    """_terms(string) -> set(string)
+
+    Returns the words of the utf-8 text, in lower case, that are worth
+    indexing."""
+    words = _WORDS.findall(text.decode('utf-8', 'replace').lower())
+    return set([x.encode('utf-8') for x in words if len(x) <= 40])
+
+def _doc_terms(doc):
+    """_doc_terms(dict) -> set(string)
+
+    Returns the terms of a document, from its fields and its messages."""
+    terms = set(doc['fields'])
+    for msgterms in doc['messages'].values():
+        terms |= msgterms
+    return terms
+
+def _apply(doc, change):
+    """_apply(dict|None, dict) -> dict
+
+    Returns a copy of the document, as read from the file, with the change
+    made by this process to it."""
+    if doc is None:
+        doc = {'folder': '', 'authors': '', 'subject': '', 'fields': set(),
+               'messages': {}}
+    doc = dict(doc)
+    doc['messages'] = dict(doc['messages'])
+    if change['fields'] is not None:
+        (doc['folder'], doc['authors'], doc['subject'],
+         doc['fields']) = change['fields']
+    for msgid, terms in change['messages'].items():
+        if msgid not in doc['messages']:
+            doc['messages'][msgid] = terms
+    return doc
+
+
+class SearchIndex:
+    """An inverted index, kept on disk, of the threads' subjects, authors and
+    of the text of the messages that were read.
+
+    Each indexed thread is a document, its terms are the ones from its
+    fields and from all its messages. The changes are kept in memory until
+    flush() is called, when they're merged with the documents in the file,
+    so several gmailreaders may share the index. The file is locked while
+    it's open: searching keeps it open, for reading, until close() or flush()
+    is called."""
+
+    def __init__(self, fname):
+        """__init__(self, string)
+
+        fname is the file where the index is kept."""
+        self.fname = fname
+        self.db = None
+        self.lockfile = None
+        self.writing = False
+        self.lock = threading.Lock()
+        # thread id -> {'fields': (folder, authors, subject, terms)|None,
+        #               'messages': {message id: terms}}, not written yet
+        self.dirty = {}
+
+    def __open(self, write=False):
+        """Opens the file, locked for reading or, if write is True, for
+        writing, unless it's open already. The lock is held until
+        __close()."""
+        if self.db is not None and (self.writing or not write):
+            return
+        self.__close()
+        lockfile = self.__private(open, self.fname + '.lock', 'w')
+        if write:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX)
+            self.db = self.__private(shelve.open, self.fname, 'c', protocol=2)
+        else:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_SH)
+            try:
+                self.db = shelve.open(self.fname, 'r', protocol=2)
+            except anydbm.error:
+                # nothing was written yet
+                lockfile.close()
+                self.db = {}
+                return
+        self.lockfile = lockfile
+        self.writing = write
+
+    def __private(self, f, *args, **kwargs):
+        # the index has words of the e-mails, only the user may read the
+        # files f creates
+        old = os.umask(0077)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            os.umask(old)
+
+    def __close(self):
+        if self.lockfile is not None:
+            self.db.close()
+            self.lockfile.close()
+            self.lockfile = None
+        self.db = None
+        self.writing = False
+
+    def __document(self, threadid):
+        """The document of threadid with the changes not written yet, or
+        None if it isn't indexed."""
+        self.__open()
+        doc = self.db.get('d:' + threadid)
+        change = self.dirty.get(threadid)
+        if change is not None:
+            doc = _apply(doc, change)
+        return doc
+
+    def __change(self, threadid):
+        if threadid not in self.dirty:
+            self.dirty[threadid] = {'fields': None, 'messages': {}}
+        return self.dirty[threadid]
+
+    def add_thread(self, threadid, folder, authors, subject):
+        """add_thread(self, string, string, string, string) -> None
+
+        Indexes (or updates) the thread's folder, authors and subject."""
+        fields = (folder, authors, subject, _terms(authors + ' ' + subject))
+        self.lock.acquire()
+        try:
+            self.__change(threadid)['fields'] = fields
+        finally:
+            self.lock.release()
+
+    def add_message(self, threadid, msgid, text):
+        """add_message(self, string, string, string) -> None
+
+        Indexes the text of a message of the thread. Messages already indexed
+        are left as they are."""
+        terms = _terms(text)
+        self.lock.acquire()
+        try:
+            self.__change(threadid)['messages'][msgid] = terms
+        finally:
+            self.lock.release()
+
+    def document(self, threadid):
+        """document(self, string) -> dict|None
+
+        Returns what's known about the thread: its folder, authors, subject
+        and the ids of the messages indexed (the keys of messages)."""
+        self.lock.acquire()
+        try:
+            return self.__document(threadid)
+        finally:
+            self.lock.release()
+
+    def search(self, query):
+        """search(self, string) -> [string]
+
+        Returns the ids of the threads having every word of query, newest
+        first."""
+        terms = _terms(query)
+        if not terms:
+            return []
+        self.lock.acquire()
+        try:
+            self.__open()
+            result = None
+            for term in terms:
+                postings = set(self.db.get('t:' + term, ()))
+                if result is None:
+                    result = postings
+                else:
+                    result &= postings
+            # the changes not written yet count too
+            for threadid in self.dirty.keys():
+                if terms <= _doc_terms(self.__document(threadid)):
+                    result.add(threadid)
+                else:
+                    result.discard(threadid)
+        finally:
+            self.lock.release()
+
+        def age(threadid):
+            # gmail's thread ids grow with time
+            try:
+                return -int(threadid, 16)
+            except ValueError:
+                return 0
+        result = list(result)
+        result.sort(key=age)
+        return result
+
+    def flush(self):
+        """flush(self) -> None
+
+        Merges the changes with the index in the file and closes it."""
+        self.lock.acquire()
+        try:
+            if not self.dirty:
+                self.__close()
+                return
+            self.__open(True)
+            try:
+                self.__merge()
+                self.dirty = {}
+            finally:
+                self.__close()
+        finally:
+            self.lock.release()
+
+    def __merge(self):
+        db = self.db
+        for threadid, change in self.dirty.items():
+            key = 'd:' + threadid
+            old = db.get(key)
+            new = _apply(old, change)
+            if new == old:
+                continue
+            db[key] = new
+
+            if old is None:
+                oldterms = set()
+            else:
+                oldterms = _doc_terms(old)
+            newterms = _doc_terms(new)
+            for term in newterms - oldterms:
+                postings = set(db.get('t:' + term, ()))
+                postings.add(threadid)
+                db['t:' + term] = postings
+            for term in oldterms - newterms:
+                postings = set(db.get('t:' + term, ()))
+                postings.discard(threadid)
+                if postings:
+                    db['t:' + term] = postings
+                elif db.has_key('t:' + term):
+                    del db['t:' + term]
+
+    def close(self):
+        """close(self) -> None
+
+        Writes the changes and closes the file of the index."""
+        self.flush()
@@ -0,0 +1,325 @@
+"""Benchmarks of the code that runs for every listing and every e-mail opened.
+
+usage: python bench.py [-s] [-b FILE] [-t THRESHOLD] [NAME ...]
+
+Everything runs on synthetic e-mails, with HOME pointing to a temporary
+directory, so neither gmail nor ~/.gmailreader is touched and libgmail isn't
+needed. With -s the times are saved as the baseline, otherwise they are
+compared to it and the ones slower than the threshold are reported (and make
+the exit status 1). Only the benchmarks whose names start with one of the
+NAMEs are run."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import time
+import atexit
+import base64
+import shutil
+import tempfile
+import subprocess
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+# configvars creates its files as soon as it's imported
+HOME = tempfile.mkdtemp()
+os.environ['HOME'] = HOME
+SRC = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SRC)
+
+import fields
+import MIMEParser
+import gmailreader
+from tabler import tabler
+
+# importing gmailreader may not take longer than this, in seconds
+STARTUP_BUDGET = 0.1
+
+# synthetic corpora
+
+def _rows(n):
+    return [(str(i), ['', 'N'][i % 3 == 0], 'Author %d <author%d@example.com>'
+             % (i, i), 'Subject of the thread number %d' % i)
+            for i in xrange(n)]
+
+def _fields(n):
+    """Author and subject fields, as gmail sends them."""
+    result = []
+    for i in xrange(n):
+        result.append('<span id="_upro_person%d@example.com">Jos\\u00e9 %d'
+                      '</span>, <span id="_upro_me@gmail.com">me</span>'
+                      % (i, i))
+        result.append('Re: &quot;report&quot; for week %d &amp; the '
+                      '<b>budget</b> &#8212; \\u00e7a va' % i)
+    return result
+
+_PARAGRAPH = ('Lorem ipsum dolor sit amet, consectetur adipisicing elit, '
+              'sed do eiusmod tempor incididunt ut labore et dolore magna '
+              'aliqua. Ut enim ad minim veniam, quis nostrud exercitation.\n')
+
+_HEADERS = """From: Someone <someone@example.com>
+To: me@gmail.com, other@example.com
+Cc: third@example.com
+Date: Mon, 3 Mar 2008 10:00:00 -0300
+Subject: =?iso-8859-1?q?Relat=F3rio?= %(n)d
+Message-ID: <%(n)d@example.com>
+MIME-Version: 1.0
+"""
+
+def _plain(n=0, paragraphs=40):
+    return (_HEADERS % {'n': n} + 'Content-Type: text/plain; charset=utf-8\n'
+            '\n' + paragraphs * _PARAGRAPH)
+
+def _html_body(paragraphs=40):
+    return ('<html><body><h1>Title</h1>' +
+            paragraphs * ('<p>%s <a href="http://example.com/">link</a> '
+                          '&amp; <b>bold</b></p>\n' % _PARAGRAPH) +
+            '<ul><li>one</li><li>two</li></ul><blockquote>quoted</blockquote>'
+            '</body></html>\n')
+
+def _html():
+    return (_HEADERS % {'n': 0} + 'Content-Type: text/html; charset=utf-8\n\n'
+            + _html_body())
+
+def _attachment(size):
+    data = base64.encodestring(size * '\xa5')
+    return ('--outer\nContent-Type: application/pdf; name="a.pdf"\n'
+            'Content-Transfer-Encoding: base64\n'
+            'Content-Disposition: attachment; filename="a.pdf"\n\n' + data)
+
+def _multipart(size=100 * 1024):
+    return (_HEADERS % {'n': 0} +
+            'Content-Type: multipart/mixed; boundary="outer"\n\n'
+            '--outer\nContent-Type: multipart/alternative; boundary="alt"\n\n'
+            '--alt\nContent-Type: text/plain; charset=utf-8\n\n' +
+            10 * _PARAGRAPH +
+            '--alt\nContent-Type: text/html; charset=utf-8\n\n' +
+            _html_body(10) + '--alt--\n' +
+            '--outer\nContent-Type: message/rfc822\n\n' + _plain(1, 5) +
+            _attachment(size) + '--outer--\n')
+
+def _digest(n=30):
+    parts = ['--digest\n\n' + _plain(i, 3) for i in xrange(n)]
+    return (_HEADERS % {'n': 0} +
+            'Content-Type: multipart/digest; boundary="digest"\n\n' +
+            ''.join(parts) + '--digest--\n')
+
+def _huge():
+    return _multipart(10 * 1024 * 1024)
+
+# benchmarks, each returns the function to be timed
+
+class _Account:
+    name = 'me@gmail.com'
+
+_states = []
+
+def _reader():
+    state = gmailreader.AccountState()
+    _states.append(state)
+    return gmailreader.ReadEmail('', state, _Account())
+
+def _cleanup():
+    # the search index must be closed while its files are still there
+    for state in _states:
+        if state.search_index is not None:
+            state.search_index.close()
+    shutil.rmtree(HOME, True)
+atexit.register(_cleanup)
+
+def bench_tabler():
+    rows = _rows(500)
+    return lambda: list(tabler(rows))
+
+def bench_tabler_widths():
+    rows = _rows(500)
+    widths = [3, 1, 0, 0]
+    return lambda: list(tabler(iter(rows), widths))
+
+def bench_fix_field():
+    corpus = _fields(250)
+    def run():
+        fields._cache.clear()
+        for x in corpus:
+            fields.fix_field(x)
+    return run
+
+def bench_fix_field_cached():
+    corpus = _fields(250)
+    for x in corpus:
+        fields.fix_field(x)
+    def run():
+        for x in corpus:
+            fields.fix_field(x)
+    return run
+
+def _parse(text):
+    return lambda: MIMEParser.MIMEParser(text)
+
+def bench_mime_plain():
+    return _parse(_plain())
+
+def bench_mime_html():
+    return _parse(_html())
+
+def bench_mime_multipart():
+    return _parse(_multipart())
+
+def bench_mime_digest():
+    return _parse(_digest())
+
+def bench_mime_huge():
+    return _parse(_huge())
+
+def bench_format():
+    text = _multipart()
+    reader = _reader()
+    return lambda: reader._ReadEmail__format(text, '1', '1')
+
+def bench_reply_maker():
+    reader = _reader()
+    text = reader._ReadEmail__format(_multipart(), '1', '1')
+    return lambda: reader._ReadEmail__reply_maker(text)
+
+BENCHMARKS = [('tabler', bench_tabler),
+              ('tabler_widths', bench_tabler_widths),
+              ('fix_field', bench_fix_field),
+              ('fix_field_cached', bench_fix_field_cached),
+              ('mime_plain', bench_mime_plain),
+              ('mime_html', bench_mime_html),
+              ('mime_multipart', bench_mime_multipart),
+              ('mime_digest', bench_mime_digest),
+              ('mime_huge', bench_mime_huge),
+              ('format', bench_format),
+              ('reply_maker', bench_reply_maker)]
+
+def measure(f, repeat=5, mintime=0.2):
+    """measure(f() -> object, int, float) -> float
+
+    Returns the time, in seconds, of one call of f: the best of repeat runs,
+    each calling f as many times as needed to take mintime seconds."""
+    loops = 1
+    while 1:
+        start = time.time()
+        for i in xrange(loops):
+            f()
+        elapsed = time.time() - start
+        if elapsed >= mintime:
+            break
+        loops *= 2
+    best = elapsed / loops
+    for i in xrange(repeat - 1):
+        start = time.time()
+        for i in xrange(loops):
+            f()
+        best = min(best, (time.time() - start) / loops)
+    return best
+
+def startup(repeat=5):
+    """startup(int) -> float
+
+    Returns the time, in seconds, importing gmailreader adds to the start
+    of the interpreter."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = SRC
+    def run(code):
+        best = None
+        for i in xrange(repeat):
+            start = time.time()
+            subprocess.call([sys.executable, '-c', code], env=env)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
+    return max(0.0, run('import gmailreader') - run('pass'))
+
+def _pretty(t):
+    if t is None:
+        return '-'
+    elif t >= 1:
+        return '%.2fs' % t
+    elif t >= 1e-3:
+        return '%.2fms' % (t * 1e3)
+    else:
+        return '%.1fus' % (t * 1e6)
+
+def main():
+    parser = OptionParser(usage='%prog [-s] [-b FILE] [-t THRESHOLD] [NAME ...]')
+    parser.add_option('-s', '--save', action='store_true', default=False,
+                      help='save the results as the new baseline')
+    parser.add_option('-b', '--baseline', default='bench.json',
+                      help='file of the baseline [default: %default]')
+    parser.add_option('-t', '--threshold', type='float', default=0.2,
+                      help='how much slower than the baseline is a '
+                           'regression [default: %default]')
+    (options, names) = parser.parse_args()
+
+    benchmarks = [(x, f) for x, f in BENCHMARKS + [('startup', None)]
+                  if not names or [n for n in names if x.startswith(n)]]
+    baseline = {}
+    if os.path.isfile(options.baseline):
+        baseline = json.load(open(options.baseline))
+
+    results = {}
+    regressions = []
+    print '%-18s %10s %10s %8s' % ('benchmark', 'time', 'baseline', 'change')
+    for name, setup in benchmarks:
+        if setup is None:
+            t = startup()
+        else:
+            t = measure(setup())
+        results[name] = t
+        base = baseline.get(name)
+        change = ''
+        if base:
+            change = '%+.0f%%' % ((t / base - 1) * 100)
+            if t > base * (1 + options.threshold):
+                regressions.append(name)
+                change += ' slower'
+        if name == 'startup' and t > STARTUP_BUDGET:
+            regressions.append(name)
+            change += ' over the %s budget' % _pretty(STARTUP_BUDGET)
+        print '%-18s %10s %10s %8s' % (name, _pretty(t), _pretty(base), change)
+        sys.stdout.flush()
+
+    if options.save:
+        baseline.update(results)
+        f = open(options.baseline, 'w')
+        json.dump(baseline, f, indent=1, sort_keys=True)
+        f.close()
+        print 'Baseline saved in %s' % options.baseline
+    elif regressions:
+        print 'Regressions: %s' % ', '.join(regressions)
+        raise SystemExit, 1
+
+if __name__ == '__main__':
+    main()
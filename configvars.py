@@ -33,23 +33,111 @@ import sys
 from Config import Config
 
 # global variables setup
-if os.system('mkdir -p ~/.gmailreader'):
-    sys.stderr.write('Unable to create ~/.gmailreader\n')
-    raise SystemExit, 1
+DIR = os.path.expanduser('~/.gmailreader')
+if not os.path.isdir(DIR):
+    try:
+        os.makedirs(DIR)
+    except OSError:
+        sys.stderr.write('Unable to create ~/.gmailreader\n')
+        raise SystemExit, 1
 
-DRAFT = os.path.expanduser('~/.gmailreader/draft')
+DRAFT = os.path.join(DIR, 'draft')
 if not os.path.isfile(DRAFT):
     open(DRAFT, 'w').close()
-TMP = os.path.expanduser('~/.gmailreader/tmp')
-if not os.path.isfile(TMP):
-    open(TMP, 'w').close()
+# written each time a thread is opened
+TMP = os.path.join(DIR, 'tmp')
 
-_conf = Config(os.path.expanduser('~/.gmailreader/config'))
+# the config file is only read once, everybody should use this object
+CONFIG = Config(os.path.join(DIR, 'config'))
 
 EDITOR = os.getenv('EDITOR')
 if not EDITOR:
-    EDITOR = _conf.get('editor', lambda: 'vi')
+    EDITOR = CONFIG.get('editor', lambda: 'vi')
+
+# only used for the html e-mails our own renderer can't read
+HTML2TEXT = CONFIG.get('html2text')
 
 READER = os.getenv('READER')
 if not READER:
-    READER = _conf.get('reader', lambda: EDITOR)
+    READER = CONFIG.get('reader', lambda: EDITOR)
+
+# commands always run in the background
+BACKGROUND = CONFIG.get('background', lambda: '').split()
+
+# whether long listings stop at each screenful
+PAGINATE = CONFIG.get('paginate', lambda: 'yes').lower() != 'no'
+
+# how many threads lm shows at a time, 0 for the whole folder
+try:
+    PAGE_SIZE = int(CONFIG.get('page_size', lambda: '50'))
+except ValueError:
+    sys.stderr.write('page_size must be a number\n')
+    raise SystemExit, 1
+
+# seconds between checks for new e-mail by the wait command, the interval
+# grows up to POLL_MAX_INTERVAL while there's nothing new in a folder
+try:
+    POLL_INTERVAL = float(CONFIG.get('poll_interval', lambda: '10'))
+    POLL_MAX_INTERVAL = float(CONFIG.get('poll_max_interval', lambda: '300'))
+except ValueError:
+    sys.stderr.write('poll_interval and poll_max_interval must be numbers\n')
+    raise SystemExit, 1
+
+# e-mails of each account waiting to be sent
+OUTBOX = os.path.join(DIR, 'outbox.%s')
+
+# cookies of the last login of each account
+SESSION = os.path.join(DIR, 'session.%s')
+
+# where the sync daemon listens and the folders it keeps up to date
+SOCKET = os.path.join(DIR, 'socket')
+DAEMON_FOLDERS = CONFIG.get('daemon_folders', lambda: 'inbox').split()
+
+# the label names of each account are kept for LABEL_TTL seconds
+LABELS = os.path.join(DIR, 'labels.%s')
+try:
+    LABEL_TTL = float(CONFIG.get('label_ttl', lambda: '3600'))
+except ValueError:
+    sys.stderr.write('label_ttl must be a number of seconds\n')
+    raise SystemExit, 1
+
+# the search index of each account
+INDEX = os.path.join(DIR, 'index.%s')
+
+# how many unread threads are rendered after lm, before they're opened
+try:
+    PREFETCH = int(CONFIG.get('prefetch', lambda: '3'))
+except ValueError:
+    sys.stderr.write('prefetch must be a number\n')
+    raise SystemExit, 1
+
+# megabytes of rendered messages kept in memory
+try:
+    RENDER_CACHE_SIZE = int(CONFIG.get('render_cache_size',
+                                       lambda: '10')) * 1024 * 1024
+except ValueError:
+    sys.stderr.write('render_cache_size must be a number of megabytes\n')
+    raise SystemExit, 1
+
+# raw messages are kept here so they don't need to be downloaded again
+STORE = os.path.join(DIR, 'messages')
+try:
+    STORE_SIZE = int(CONFIG.get('store_size', lambda: '50')) * 1024 * 1024
+except ValueError:
+    sys.stderr.write('store_size must be a number of megabytes\n')
+    raise SystemExit, 1
+
+# how many requests may be made to gmail at the same time
+try:
+    THREADS = int(CONFIG.get('threads', lambda: '4'))
+except ValueError:
+    sys.stderr.write('threads must be a number\n')
+    raise SystemExit, 1
+
+# seconds the connections to gmail are kept open while not used, 0 makes a
+# new connection for each request
+try:
+    KEEPALIVE = float(CONFIG.get('keepalive', lambda: '60'))
+except ValueError:
+    sys.stderr.write('keepalive must be a number of seconds\n')
+    raise SystemExit, 1
@@ -0,0 +1,83 @@
+"""Cleans up the subject and author fields as sent by gmail."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import re
+
+from htmlentitydefs import name2codepoint
+
+from LRUCache import LRUCache
+
+# \uXXXX escapes left by gmail's javascript
+_ESCAPE = re.compile(r'\\u([0-9a-fA-F]{4})')
+# The authors come as <span id="_upro_e-mail">Name</span>, other tags are
+# just dropped
+_MARKUP = re.compile(r'<span\b[^>]*?\bid=["\']?_upro_([^"\'>\s]*)[^>]*>(.*?)'
+                     r'</span\s*>|</?[A-Za-z!][^>]*>|&(#[xX]?)?(\w+);',
+                     re.DOTALL | re.IGNORECASE)
+
+# Both fields repeat a lot along a folder and between listings
+_cache = LRUCache(2048)
+
+def _unescape(m):
+    return unichr(int(m.group(1), 16)).encode('utf-8')
+
+def _entity(ref, name):
+    try:
+        if ref is None:
+            return unichr(name2codepoint[name]).encode('utf-8')
+        elif ref == '#':
+            return unichr(int(name)).encode('utf-8')
+        else:
+            return unichr(int(name, 16)).encode('utf-8')
+    except (KeyError, ValueError, OverflowError):
+        return '&%s%s;' % (ref or '', name)
+
+def _markup(m):
+    (email, name, ref, entity) = m.groups()
+    if entity is not None:
+        return _entity(ref, entity)
+    elif name is not None:
+        return '%s <%s>' % (_MARKUP.sub(_markup, name), email)
+    else:
+        return ''
+
+def fix_field(s):
+    """fix_field(string) -> string
+
+    Decodes the escapes, html tags and entities of a subject or author field
+    as it's received from gmail, returning it as a utf-8 string."""
+    fixed = _cache.get(s)
+    if fixed is None:
+        fixed = s
+        if '\\u' in fixed:
+            fixed = _ESCAPE.sub(_unescape, fixed)
+        if '<' in fixed or '&' in fixed:
+            fixed = _MARKUP.sub(_markup, fixed)
+        fixed = fixed.strip()
+        _cache.put(s, fixed)
+    return fixed
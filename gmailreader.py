@@ -28,29 +28,42 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 import sys
-import readline
-import subprocess
 import os
 import os.path
-import email
-import select
-import urllib2
-import shutil
-import HTMLParser
+import threading
+import time
+import weakref
 
 from getpass import getpass
-from htmlentitydefs import entitydefs
-from mimify import mime_decode_header
-
-import libgmail
-
-from MIMEParser import MIMEParser
+from itertools import islice
+
+from lazy import LazyModule
+from MessageStore import MessageStore
+from LabelCache import LabelCache
+from LRUCache import LRUCache
+from Outbox import Outbox
+from Prefetcher import Prefetcher
+from jobs import Jobs
+from SearchIndex import SearchIndex
+from workers import pmap, pmap_each
+import stats
 import configvars as conf
-from Config import Config
-from tabler import tabler
-
-# Time (in seconds) to wait between e-mail checks
-TIMEOUT = 10
+from tabler import tabler, page
+from fields import fix_field
+
+# Only imported when a command needs them, so startup is quick
+subprocess = LazyModule('subprocess')
+email = LazyModule('email')
+select = LazyModule('select')
+urllib2 = LazyModule('urllib2')
+shutil = LazyModule('shutil')
+mimify = LazyModule('mimify')
+libgmail = LazyModule('libgmail')
+MIMEParser = LazyModule('MIMEParser')
+Poller = LazyModule('Poller')
+transport = LazyModule('transport')
+# only needed when a sync daemon is running, or to run one
+sync = LazyModule('sync')
 
 # These are the constants identifying the commands
 LIST_FOLDERS = 'lf'
@@ -62,6 +75,13 @@ COMPOSE = 'c'
 SEND_DRAFT = 's'
 REPORT_SPAM = '!'
 WAIT_EMAIL = 'wait'
+SEARCH = 'search'
+OUTBOX = 'outbox'
+STATS = 'stats'
+SAVE = 'save'
+JOBS = 'jobs'
+KILL = 'kill'
+ACCOUNT = 'acc'
 HELP = 'help'
 QUIT = 'q'
 
@@ -80,34 +100,6 @@ class ExecutionError(Exception):
         return repr(self.message)
 
 
-class FieldParser(HTMLParser.HTMLParser):
-    """This is an HTML Parser which ignores any tag except span. Only the data
-    between <span> is stored in the text attribute.
-    
-    This is handy for filtering out the HTML on subject and author fields."""
-
-    def __init__(self):
-        HTMLParser.HTMLParser.__init__(self)
-        self.inside_span = False
-        self.email = ''
-        self.text = ''
-
-    def handle_starttag(self, tag, attrs):
-        if tag == 'span':
-            self.inside_span = True
-            self.email = dict(attrs)['id'].replace('_upro_', '')
-
-    def handle_data(self, data):
-        if self.inside_span:
-            self.text += data + (' <%s>' % self.email)
-        else:
-            self.text += data
-
-    def handle_endtag(self, tag):
-        if tag == 'span':
-            self.inside_span = False
-
-
 class AccountState:
     """This class have variables that must be shared along the commands. The
     ReadEmail command must know what were the last messages displayed to the
@@ -117,14 +109,34 @@ class AccountState:
         # starting directory is not a label
         self.current_dir = 'inbox'
         self.isLabel = False
+        # labels as numbered by the last lf command
         self.labels = []
-        # threads from the last lm command
-        self.active_threads = []
+        self.label_cache = None
+        # threads from the last lm command, by the number shown to the user
+        self.active_threads = {}
+        # where `lm n' starts listing
+        self.next_thread = 0
+        # all the pages of the current folder, once lm went past the first
+        # one, so `lm n' doesn't download them again
+        self.listing = None
+        # the first page of the inbox, when it was listed at startup, for
+        # the first lm
+        self.inbox = None
+        self.search_index = None
+        self.outbox = None
+        # renders the unread threads of the last lm before they're opened
+        self.prefetcher = None
+        # threads listed in this session that are still around, by id, so
+        # the ones found by search can be downloaded
+        self.threads = weakref.WeakValueDictionary()
 
 
 class Command:
     """This is the basic unit of the program. All the user does is type down
     commands which will give him messages on the screen."""
+    # whether it may run in the background, only the commands that don't
+    # read from the user or use the terminal may
+    background = False
 
     def __init__(self, s, state, acc):
         """__init__(self, string, AccountState, GmailAccount)
@@ -139,41 +151,106 @@ class Command:
         AccountState that was passed to the object's __init__."""
         pass
 
+    def all_labels(self, refresh=False):
+        """all_labels(self, bool) -> [string]
 
-class ListFolders(Command):
-    def execute(self):
-        # folders like inbox, all, etc are threated differently than labels by
-        # libgmail.
-        if self.acc.getLabelNames():
-            all_labels = libgmail.STANDARD_FOLDERS + self.acc.getLabelNames()
-        else:
-            all_labels = libgmail.STANDARD_FOLDERS
-        self.state.labels = list(all_labels)
+        Returns the standard folders followed by the account's labels. The
+        labels come from the label cache unless refresh is True."""
+        if self.state.label_cache is None:
+            self.state.label_cache = LabelCache(conf.LABELS % self.acc.name,
+                                                conf.LABEL_TTL,
+                                                self.acc.getLabelNames)
+        # folders like inbox, all, etc are threated differently than labels
+        # by libgmail.
+        return list(libgmail.STANDARD_FOLDERS) +\
+               self.state.label_cache.get(refresh)
 
-        for i, name in enumerate(all_labels):
-            print i, name
+    def search_index(self):
+        """search_index(self) -> SearchIndex
+
+        Returns the search index of the account."""
+        if self.state.search_index is None:
+            self.state.search_index = SearchIndex(conf.INDEX % self.acc.name)
+        return self.state.search_index
+
+    def outbox(self):
+        """outbox(self) -> Outbox
 
+        Returns the outbox of the account, its e-mails are sent by acc."""
+        if self.state.outbox is None:
+            acc = self.acc
+            self.state.outbox = Outbox(conf.OUTBOX % acc.name,
+                                       lambda text: _send(acc, text))
+        return self.state.outbox
+
+    def stop_prefetch(self):
+        """stop_prefetch(self) -> None
+
+        Stops rendering the threads of the last listing in the background."""
+        if self.state.prefetcher is not None:
+            self.state.prefetcher.cancel()
+            self.state.prefetcher = None
+
+
+class ListFolders(Command):
+    background = True
 
-class Archive(Command):
     def __init__(self, s, state, acc):
         """__init__(self, string, AccountState, GmailAccount)
 
         Differently than the standard __init__, it will take the string s into
-        account as the command's arguments."""
+        account as the command's arguments: -r asks gmail for the labels
+        instead of using the ones in the cache."""
         Command.__init__(self, s, state, acc)
         self.arg = s.strip()
 
     def execute(self):
-        try:
-            self.acc.archiveThread(self.state.active_threads[int(self.arg)])
-        except AttributeError:
-            print "Version %s of libgmail doesn't support archiving" %\
-                  libgmail.Version
-        except ValueError:
-            raise ExecutionError("`ar' expects a number as parameter")
+        if self.arg not in ('', '-r'):
+            raise ExecutionError("usage: lf [-r]")
+        self.state.labels = self.all_labels(self.arg == '-r')
+
+        for i, name in enumerate(self.state.labels):
+            print i, name
+
 
+def _numbers(s):
+    """_numbers(string) -> [int]
+
+    Reads a list of numbers and ranges like `0-19,25,31', returning each
+    number once, in the order given. Raises ValueError if s isn't like that."""
+    numbers = []
+    for item in s.replace(' ', ',').split(','):
+        if not item:
+            continue
+        if '-' in item[1:]:
+            (first, last) = item.split('-', 1)
+            numbers.extend(range(int(first), int(last) + 1))
+        else:
+            numbers.append(int(item))
+    if not numbers:
+        raise ValueError(s)
+
+    seen = {}
+    unique = []
+    for x in numbers:
+        if x not in seen:
+            seen[x] = True
+            unique.append(x)
+    return unique
+
+
+class ThreadsCommand(Command):
+    """Base of the commands that change the threads listed by lm. The
+    threads are given by numbers and ranges (like `0-19,25,31') and the
+    requests for them are made at the same time. Each thread that fails is
+    reported, the others are removed from the active threads, keeping the
+    numbers of those left."""
+    background = True
+    # command name and the GmailAccount method called for each thread
+    NAME = None
+    METHOD = None
+    UNSUPPORTED = None
 
-class ReportSpam(Command):
     def __init__(self, s, state, acc):
         """__init__(self, string, AccountState, GmailAccount)
 
@@ -184,12 +261,58 @@ class ReportSpam(Command):
 
     def execute(self):
         try:
-            self.acc.reportSpam(self.state.active_threads[int(self.arg)])
-        except AttributeError:
-            print "Version %s of libgmail doesn't support spam reporting" %\
-                  libgmail.Version
+            numbers = _numbers(self.arg)
         except ValueError:
-            raise ExecutionError("`!' expects a number as parameter")
+            raise ExecutionError("`%s' expects numbers or ranges like "
+                                 "`0-19,25' as parameter" % self.NAME)
+        active = self.state.active_threads
+        invalid = [str(x) for x in numbers if x not in active]
+        if invalid:
+            raise ExecutionError("Invalid thread number: %s" %
+                                 ', '.join(invalid))
+        try:
+            action = getattr(self.acc, self.METHOD)
+        except AttributeError:
+            print self.UNSUPPORTED % libgmail.Version
+            return
+
+        # the calls are made by other threads, which don't know of the job
+        job = CommandFactory.jobs.job()
+        def act(x):
+            if job is not None and job.cancelled():
+                return False
+            action(active[x])
+            return True
+
+        results = pmap_each(act, numbers, conf.THREADS)
+        done = []
+        for n, (r, e) in zip(numbers, results):
+            if e is not None:
+                print 'Error on thread %d: %s' % (n, str(e) or
+                                                     e.__class__.__name__)
+            elif r:
+                done.append(n)
+
+        # another listing may have been made meanwhile, by cd or lm
+        if self.state.active_threads is not active:
+            return
+        self.state.active_threads = dict([(k, v) for k, v in active.items()
+                                          if k not in done])
+        if done:
+            # the threads left are numbered differently by gmail now
+            self.state.listing = None
+
+
+class Archive(ThreadsCommand):
+    NAME = ARCHIVE
+    METHOD = 'archiveThread'
+    UNSUPPORTED = "Version %s of libgmail doesn't support archiving"
+
+
+class ReportSpam(ThreadsCommand):
+    NAME = REPORT_SPAM
+    METHOD = 'reportSpam'
+    UNSUPPORTED = "Version %s of libgmail doesn't support spam reporting"
 
 
 class EnterFolder(Command):
@@ -208,11 +331,8 @@ class EnterFolder(Command):
 
         if self.state.labels:
             all_labels = self.state.labels
-        elif self.acc.getLabelNames():
-            all_labels = list(libgmail.STANDARD_FOLDERS +
-                              self.acc.getLabelNames())
         else:
-            all_labels = list(libgmail.STANDARD_FOLDERS)
+            all_labels = self.all_labels()
 
         try:
             i = int(self.arg)
@@ -221,79 +341,145 @@ class EnterFolder(Command):
             raise ExecutionError("Label %s doesn't exist" % i)
         except ValueError:
             label = self.arg
-            if label not in all_labels:
+            # it may have been created after the cache was filled
+            if label not in all_labels and label not in self.all_labels(True):
                 raise ExecutionError("Label %s doesn't exist" % label)
             else:
                 self.state.current_dir = label
 
-        self.state.active_threads = []
+        self.stop_prefetch()
+        self.state.active_threads = {}
+        self.state.next_thread = 0
+        self.state.listing = None
+        self.state.inbox = None
         self.state.isLabel = not self.state.current_dir in\
                                  libgmail.STANDARD_FOLDERS
 
 
 class ListEmails(Command):
-    def execute(self):
-        if self.state.isLabel:
-            conversations = self.acc.getMessagesByLabel(self.state.current_dir)
-        else:
-            conversations = self.acc.getMessagesByFolder(self.state.current_dir)
+    background = True
+    # how many threads gmail sends in each page of results
+    GMAIL_PAGE = 50
 
-        self.state.active_threads = list(conversations)
-
-        t = []
-        for i, c in enumerate(conversations):
-            t.append((str(i),
-                      ['', 'N'][bool(c.unread)],
-                      self.__fix_all(c.authors),
-                      self.__fix_all(c.subject),
-                     )
-                    )
-
-        for line in tabler(t):
-            print line
+    def __init__(self, s, state, acc):
+        """__init__(self, string, AccountState, GmailAccount)
 
-    #XXX: helper functions. They're ok for now, but I might want to revist them,
-    #     maybe write something better as the project moves
-    def __fix_all(self, s):
-        s = self.__fix_encoding(s)
-        s = self.__fix_html(s)
-        s = self.__entitytoletter(s)
+        Differently than the standard __init__, it will take the string s into
+        account as the command's arguments: either nothing, `n' or the number
+        of the first thread to be listed, optionally followed by how many
+        threads to list."""
+        Command.__init__(self, s, state, acc)
+        self.arg = s.split()
 
-        return s
+    def __window(self):
+        """__window(self) -> (int, int|None)
 
-    def __entitytoletter(self, s):
-        newdefs = []
-        for k, v in entitydefs.items():
-            newdefs.append(('&'+k+';', v))
+        Returns the number of the first thread to be listed and how many of
+        them should be listed (None means all of them)."""
+        count = conf.PAGE_SIZE or None
+        if not self.arg:
+            return (0, count)
+        if self.arg == ['n']:
+            return (self.state.next_thread, count)
+        try:
+            start = int(self.arg[0])
+            if len(self.arg) > 1:
+                count = int(self.arg[1])
+        except ValueError:
+            raise ExecutionError("`lm' expects numbers or `n' as parameters")
+        if len(self.arg) > 2 or start < 0 or (count is not None and
+                                               count <= 0):
+            raise ExecutionError("usage: lm [<start> [<count>]] | lm n")
+        return (start, count)
 
-        for k, v in newdefs:
-            s = s.replace(k, v)
+    def __conversations(self, allPages=False):
+        if self.state.isLabel:
+            return self.acc.getMessagesByLabel(self.state.current_dir,
+                                               allPages)
+        else:
+            return self.acc.getMessagesByFolder(self.state.current_dir,
+                                                allPages)
+
+    def __prefetch(self, window):
+        """Starts rendering the first unread threads of the window, which
+        are likely to be opened next."""
+        unread = [c for i, c in window if c.unread][:conf.PREFETCH]
+        if not unread:
+            return
+        reader = ReadEmail('', self.state, self.acc)
+        def render(conversation):
+            for text in reader.render(conversation):
+                if prefetcher.cancelled():
+                    break
+            self.search_index().flush()
+        prefetcher = Prefetcher(render, unread)
+        self.state.prefetcher = prefetcher
+        prefetcher.start()
 
-        return s
+    def execute(self):
+        (start, count) = self.__window()
+        self.stop_prefetch()
+        if count is None:
+            stop = None
+        else:
+            stop = start + count
+
+        # Only gmail's first page of results comes by default, the whole
+        # folder is only downloaded when the window goes beyond that page.
+        # It's then kept until lm is called without arguments, which lists
+        # the folder afresh, or the folder changes.
+        inbox = self.state.inbox
+        self.state.inbox = None
+        listing = self.state.listing
+        if not self.arg or listing is None:
+            listing = None
+            if inbox is not None and self.state.current_dir == 'inbox':
+                conversations = inbox
+            else:
+                conversations = list(self.__conversations())
+            if stop is None or stop > len(conversations):
+                if len(conversations) >= self.GMAIL_PAGE or\
+                   start >= len(conversations) > 0:
+                    conversations = list(self.__conversations(allPages=True))
+                    if self.arg:
+                        listing = conversations
+        else:
+            conversations = listing
+
+        # a killed job leaves the threads listed before, if any, alone
+        if CommandFactory.jobs.cancelled():
+            return
+        self.state.listing = listing
+        window = list(islice(enumerate(conversations), start, stop))
+        del conversations
+        self.state.active_threads = dict(window)
+        if not window:
+            self.state.next_thread = start
+            return
+        self.state.next_thread = window[-1][0] + 1
+
+        index = self.search_index()
+        def row(i, c):
+            authors = stats.stage('fields', fix_field, c.authors)
+            subject = stats.stage('fields', fix_field, c.subject)
+            stats.stage('index', index.add_thread, c.id,
+                        self.state.current_dir, authors, subject)
+            self.state.threads[c.id] = c
+            return (str(i), ['', 'N'][bool(c.unread)], authors, subject)
+
+        t = (row(i, c) for i, c in window)
+        # knowing the widths beforehand, each line is printed once it's ready
+        widths = [len(str(window[-1][0])), 1, 0, 0]
 
-    def __fix_html(self, s):
-        parser = FieldParser()
         try:
-            parser.feed(s)
-            parser.close()
-        except HTMLParser.HTMLParseError:
-            parser.text = s
-
-        return parser.text
-
-    def __fix_encoding(self, s):
-        final = []
-        i = 0
-        while i < len(s):
-            if s[i] == '\\' and s[i+1] == 'u':
-                num = int(s[i+2:i+6], 16)
-                final.append(unichr(num).encode('utf-8'))
-                i += 6
+            if conf.PAGINATE:
+                page(tabler(t, widths))
             else:
-                final.append(s[i])
-                i += 1
-
-        return ''.join(final).strip()
+                for line in tabler(t, widths):
+                    print line
+        finally:
+            stats.stage('index', index.flush)
+        self.__prefetch(window)
 
 
 import re
@@ -312,6 +498,12 @@ def _get_email(mail):
 
 class ReadEmail(Command):
     EMAIL_DIVISOR = '\n\n'+(80*'-')+'\n\n'
+    # Must change whenever the text shown for a message changes, so nothing
+    # rendered by an older version is taken from the cache
+    RENDER_VERSION = 1
+    store = MessageStore(conf.STORE, conf.STORE_SIZE)
+    # message id -> the message as it's written to the tmp file
+    rendered = LRUCache(conf.RENDER_CACHE_SIZE, len)
 
     def __init__(self, s, state, acc):
         """__init__(self, string, AccountState, GmailAccount)
@@ -324,20 +516,38 @@ class ReadEmail(Command):
     def __print_field(self, msg, field):
         value = msg.get(field)
         if value:
-            value = mime_decode_header(value)
+            value = mimify.mime_decode_header(value)
             value = value.decode('iso8859-1').encode('utf-8')
             return field.capitalize()+': '+value
         else:
             return ''
 
-    def __format(self, text, msgid):
-        msg = email.message_from_string(text)
+    def __key(self, msg):
+        # the renderer's settings are part of the key, so changing them
+        # ignores what was rendered before
+        return (msg.id, self.RENDER_VERSION, conf.HTML2TEXT)
+
+    def source(self, msg):
+        """source(self, GmailMessage) -> string
+
+        Returns the raw source of msg, only downloading it when it isn't on
+        the local store yet."""
+        source = self.store.get(msg.id)
+        if source is None:
+            source = msg.source
+            self.store.put(msg.id, source)
+        return source
+
+    def __format(self, text, msgid, threadid):
+        # the headers come from the same parse as the body
+        mp = MIMEParser.MIMEParser(text, conf.HTML2TEXT)
+        msg = mp.message
         mget = lambda field: self.__print_field(msg, field)
-
-        mp = MIMEParser(text)
         body = mp.body
         if mp.forward:
             body += '\n\n' + mp.forward
+        self.search_index().add_message(threadid, msgid,
+                                        mget('subject') + '\n' + body)
 
         fields = [mget('from'),
                   mget('to'),
@@ -403,21 +613,46 @@ class ReadEmail(Command):
 
         return newmsg.as_string()
 
+    def render(self, conversation):
+        """render(self, GmailThread) -> iter(string)
+
+        Generates the text shown for each message of the thread, only
+        downloading and rendering the ones that aren't in the caches yet.
+        The search index isn't flushed."""
+        msgs = list(conversation)
+        texts = [self.rendered.get(self.__key(x)) for x in msgs]
+
+        # all the messages not rendered yet are downloaded at once, but
+        # they're still rendered in the thread's order
+        missing = [x for x, t in zip(msgs, texts) if t is None]
+        sources = pmap(self.source, missing, conf.THREADS)
+        sources.reverse()
+
+        for msg, text in zip(msgs, texts):
+            if text is None:
+                # big messages shouldn't pile up in memory
+                text = self.__format(sources.pop(), msg.id, conversation.id)
+                self.rendered.put(self.__key(msg), text)
+            yield text
+
     def execute(self):
         try:
             conversation = self.state.active_threads[int(self.arg)]
         except ValueError:
             raise ExecutionError("`o' expects a number as parameter")
-        except IndexError:
+        except KeyError:
             raise ExecutionError("Invalid thread number")
 
         f = open(conf.TMP, 'w')
-        for msg in conversation:
-            print>>f, self.__format(msg.source, msg.id)
-        f.close()
+        try:
+            for text in self.render(conversation):
+                print>>f, text
+        finally:
+            f.close()
+            self.search_index().flush()
         mtime = os.path.getmtime(conf.TMP)
 
-        os.system('%s %s' % (conf.READER, conf.TMP))
+        stats.stage('reader', os.system, '%s %s' % (conf.READER, conf.TMP))
 
         if mtime != os.path.getmtime(conf.TMP):
             shutil.copy(conf.TMP, conf.DRAFT)
@@ -428,6 +663,8 @@ class ReadEmail(Command):
 
 
 class WaitEmail(Command):
+    background = True
+
     def __init__(self, s, state, acc):
         """__init__(self, string, AccountState, GmailAccount)
 
@@ -437,37 +674,245 @@ class WaitEmail(Command):
         Command.__init__(self, s, state, acc)
         self.arg = [x.strip() for x in s.split()]
 
-    def __search_new(self):
-        for folder in self.arg:
-            try:
-                if folder in libgmail.STANDARD_FOLDERS:
-                    conversations = self.acc.getMessagesByFolder(folder)
-                else:
-                    conversations = self.acc.getMessagesByLabel(folder)
-            except urllib2.URLError:
-                return
-            for msg in conversations:
-                if msg.unread:
-                    return folder
+    def __folder(self, name):
+        """__folder(self, string) -> (GmailAccount, string)
+
+        Returns the account and folder meant by an argument, which is a folder
+        of the current account or one of another account when prefixed by its
+        name, like `work:inbox'."""
+        if ':' in name:
+            prefix, folder = name.split(':', 1)
+            acc = CommandFactory.find(prefix)
+            if acc is not None and folder:
+                return (acc, folder)
+        return (self.acc, name)
+
+    def __fetch(self, key):
+        (acc, folder) = key
+        if folder in libgmail.STANDARD_FOLDERS:
+            return acc.getMessagesByFolder(folder)
+        else:
+            return acc.getMessagesByLabel(folder)
 
     def execute(self):
-        folder = None
-        while 1:
-            rl, wl, xl = select.select([sys.stdin],[],[],TIMEOUT)
-            if sys.stdin in rl:
-                sys.stdin.read(1)
-                break
-            folder = self.__search_new()
-            if folder:
-                break
-
-        if folder:
-            conf = Config(os.path.expanduser('~/.gmailreader/config'))
-            script = os.path.expanduser(conf.get('script'))
+        if not self.arg:
+            raise ExecutionError("`wait' expects the names of the folders")
+
+        # one poller for the folders of every account, so they're all
+        # fetched at the same time
+        keys = [self.__folder(x) for x in self.arg]
+        poller = Poller.Poller(self.__fetch, keys, (urllib2.URLError,),
+                               conf.POLL_INTERVAL, conf.POLL_MAX_INTERVAL,
+                               conf.THREADS)
+        # in the background it waits until the job is killed, otherwise
+        # until enter is pressed
+        job = CommandFactory.jobs.job()
+        changed = {}
+        while not changed:
+            if job:
+                job.cancel.wait(poller.delay())
+                if job.cancelled():
+                    break
+            else:
+                rl, wl, xl = select.select([sys.stdin], [], [],
+                                           poller.delay())
+                if sys.stdin in rl:
+                    sys.stdin.read(1)
+                    break
+            changed = poller.poll()
+
+        if changed:
+            names = [x for x, key in zip(self.arg, keys) if key in changed]
+            print 'New e-mail in: %s' % ', '.join(names)
+            script = conf.CONFIG.get('script')
             if script:
-                subprocess.call([script])
-            CommandFactory.generate('cd %s' % folder, self.acc).execute()
-            CommandFactory.generate('lm', self.acc).execute()
+                subprocess.call([os.path.expanduser(script)])
+            if job:
+                # a job leaves the folder and account being used at the
+                # prompt alone, it only tells what arrived
+                for name, key in zip(self.arg, keys):
+                    for t in changed.get(key, []):
+                        print '%s: %s  %s' % (name, fix_field(t.authors),
+                                              fix_field(t.subject))
+                return
+            (acc, folder) = self.__folder(names[0])
+            if acc is not self.acc:
+                CommandFactory.account = acc
+            CommandFactory.generate('cd %s' % folder, acc).execute()
+            CommandFactory.generate('lm', acc).execute()
+
+
+class SaveAttachment(Command):
+    def __init__(self, s, state, acc):
+        """__init__(self, string, AccountState, GmailAccount)
+
+        Differently than the standard __init__, it will take the string s into
+        account as the command's arguments: the number of the thread, then
+        optionally the number of the attachment and the file to write it."""
+        Command.__init__(self, s, state, acc)
+        self.arg = s.split()
+
+    def __attachments(self, reader, msgs):
+        """__attachments(self, ReadEmail, [GmailMessage])
+        -> [(GmailMessage, int, string, string, int)]
+
+        Lists the attachments of the messages as (message, position of the
+        attachment among the message's ones, file name, content type, size of
+        the encoded payload)."""
+        result = []
+        for msg in msgs:
+            parsed = MIMEParser.parse(reader.source(msg))
+            for i, part in enumerate(MIMEParser.attachments(parsed)):
+                name = part.get_filename()
+                if name:
+                    name = mimify.mime_decode_header(name)
+                else:
+                    name = 'part%d' % i
+                size = getattr(part, 'dropped', 0) or\
+                       len(part.get_payload() or '')
+                result.append((msg, i, name, part.get_content_type(), size))
+        return result
+
+    def execute(self):
+        if not 1 <= len(self.arg) <= 3:
+            raise ExecutionError("usage: save <thread> [<num> [<file>]]")
+        try:
+            numbers = [int(x) for x in self.arg[:2]]
+            conversation = self.state.active_threads[numbers[0]]
+        except ValueError:
+            raise ExecutionError("`save' expects numbers as parameters")
+        except KeyError:
+            raise ExecutionError("Invalid thread number")
+
+        reader = ReadEmail('', self.state, self.acc)
+        found = self.__attachments(reader, list(conversation))
+        if len(numbers) == 1:
+            if not found:
+                print 'No attachments'
+            for i, (msg, n, name, ctype, size) in enumerate(found):
+                print '%d %s (%s, %s)' % (i, name, ctype, _size(size))
+            return
+
+        try:
+            (msg, n, name, ctype, size) = found[numbers[1]]
+        except IndexError:
+            raise ExecutionError("Invalid attachment number")
+        if len(self.arg) == 3:
+            fname = os.path.expanduser(self.arg[2])
+        else:
+            # the name comes from the e-mail, it can't point anywhere else
+            fname = os.path.basename(name.replace('\\', '/')) or 'part%d' % n
+        if os.path.isdir(fname):
+            fname = os.path.join(fname, os.path.basename(name))
+        if os.path.exists(fname):
+            raise ExecutionError("%s already exists" % fname)
+
+        # the part is decoded from the source as it's written
+        text = reader.source(msg)
+        part = MIMEParser.attachments(MIMEParser.parse(text))[n]
+        f = open(fname, 'wb')
+        try:
+            MIMEParser.save(text, part, f)
+        finally:
+            f.close()
+        print 'Saved %s' % fname
+
+
+class _StoredMessage:
+    """A message of a _StoredThread, its source must be on the local store."""
+
+    def __init__(self, id):
+        self.id = id
+
+    def __getattr__(self, name):
+        if name == 'source':
+            raise ExecutionError("Message %s isn't stored locally, list its "
+                                 "folder to download it" % self.id)
+        raise AttributeError(name)
+
+
+class _StoredThread:
+    """A thread found by search that wasn't listed in this session. It has
+    the messages that were read before, they're opened from the local store."""
+
+    def __init__(self, id, doc):
+        self.id = id
+        self.unread = False
+        self.authors = doc['authors']
+        self.subject = doc['subject']
+        self.messages = doc['messages'].keys()
+        self.messages.sort()
+
+    def __iter__(self):
+        if not self.messages:
+            raise ExecutionError("Thread wasn't read before, list its folder "
+                                 "to download it")
+        return iter([_StoredMessage(x) for x in self.messages])
+
+
+class Search(Command):
+    background = True
+
+    def __init__(self, s, state, acc):
+        """__init__(self, string, AccountState, GmailAccount)
+
+        Differently than the standard __init__, it will take the string s into
+        account as the words searched."""
+        Command.__init__(self, s, state, acc)
+        self.arg = s.strip()
+
+    def execute(self):
+        if not self.arg:
+            raise ExecutionError("`search' expects the words to be searched")
+
+        index = self.search_index()
+        found = []
+        try:
+            for id in index.search(self.arg):
+                doc = index.document(id)
+                if doc is None:
+                    continue
+                thread = self.state.threads.get(id) or _StoredThread(id, doc)
+                found.append((thread, doc))
+        finally:
+            # the other gmailreaders can't write to it while it's open
+            index.close()
+
+        # o, ar and ! now refer to what was found
+        self.state.active_threads = dict(enumerate([x for x, d in found]))
+        self.state.next_thread = 0
+        if not found:
+            print 'Nothing found'
+            return
+
+        t = [(str(i), doc['folder'], doc['authors'], doc['subject'])
+             for i, (thread, doc) in enumerate(found)]
+        if conf.PAGINATE:
+            page(tabler(t))
+        else:
+            for line in tabler(t):
+                print line
+
+
+def _send(acc, text):
+    """_send(GmailAccount, string) -> None
+
+    Sends the e-mail in text, written like the draft file."""
+    attrs = email.message_from_string(text)
+    msg = libgmail.GmailComposedMessage(attrs.get('to'),
+                                        attrs.get('subject'),
+                                        attrs.get_payload(),
+                                        attrs.get('cc'),
+                                        attrs.get('bcc'))
+    try:
+        acc.sendMessage(msg, replyTo=attrs.get('in-reply-to'))
+    except TypeError:
+        warn = """
+Warning: Wrong version of libgmail being used. I'll be able to send the e-mail
+         but not to keep it organized in a thread.
+"""
+        sys.stderr.write(warn)
+        acc.sendMessage(msg)
 
 
 class SendEmail(Command):
@@ -476,20 +921,151 @@ class SendEmail(Command):
         attrs = email.message_from_string(text)
         if not attrs.get('to'):
             raise ExecutionError("No `To' field in message")
-        msg = libgmail.GmailComposedMessage(attrs.get('to'),
-                                            attrs.get('subject'),
-                                            attrs.get_payload(),
-                                            attrs.get('cc'),
-                                            attrs.get('bcc'))
+        # sent in the background, so a slow or broken connection doesn't
+        # hold the prompt
+        self.outbox().put(text)
+        print 'E-mail to %s queued for sending' % attrs.get('to')
+
+
+class ShowOutbox(Command):
+    def __init__(self, s, state, acc):
+        """__init__(self, string, AccountState, GmailAccount)
+
+        Differently than the standard __init__, it will take the string s into
+        account as the command's arguments: -r tries to send every e-mail
+        again at once."""
+        Command.__init__(self, s, state, acc)
+        self.arg = s.strip()
+
+    def execute(self):
+        if self.arg not in ('', '-r'):
+            raise ExecutionError("usage: outbox [-r]")
+        outbox = self.outbox()
+        if self.arg == '-r':
+            outbox.retry()
+
+        entries = outbox.entries()
+        if not entries:
+            print 'The outbox is empty'
+            return
+        t = []
+        for i, (text, name, status) in enumerate(entries):
+            attrs = email.message_from_string(text)
+            t.append((str(i), attrs.get('to', ''), attrs.get('subject', ''),
+                      status or 'waiting'))
+        for line in tabler(t):
+            print line
+
+
+def _size(nbytes):
+    if nbytes >= 1024 * 1024:
+        return '%.1fMB' % (nbytes / (1024.0 * 1024))
+    elif nbytes >= 1024:
+        return '%.1fKB' % (nbytes / 1024.0)
+    return '%dB' % nbytes
+
+
+class ShowStats(Command):
+    def __init__(self, s, state, acc):
+        """__init__(self, string, AccountState, GmailAccount)
+
+        Differently than the standard __init__, it will take the string s into
+        account as the command's arguments: -c forgets what was measured."""
+        Command.__init__(self, s, state, acc)
+        self.arg = s.strip()
+
+    def __print(self, record):
+        print '%-8s %5d %9.3fs %9.3fs %8d %10s' %\
+              (record.name, record.runs, record.wall,
+               record.wall / record.runs, record.requests,
+               _size(record.bytes))
+        stages = record.stages.items()
+        stages.sort()
+        if stages:
+            print '         ' + ', '.join(['%s %.3fs' % x for x in stages])
+
+    def execute(self):
+        if self.arg not in ('', '-c'):
+            raise ExecutionError("usage: stats [-c]")
+        if self.arg == '-c':
+            stats.clear()
+            return
+
+        (last, totals) = stats.report()
+        header = '%-8s %5s %10s %10s %8s %10s' % ('command', 'runs', 'total',
+                                                   'average', 'requests',
+                                                   'received')
+        if last:
+            print 'Last command:'
+            print header
+            self.__print(last)
+            print
+        if totals:
+            print 'Since gmailreader started:'
+            print header
+            for record in totals:
+                self.__print(record)
+            print
+        peak = stats.peak_memory()
+        if peak is not None:
+            print 'Peak memory: %s' % _size(peak * 1024)
+
+
+class ShowJobs(Command):
+    def execute(self):
+        jobs = CommandFactory.jobs.running()
+        if not jobs:
+            print 'No jobs running'
+        for job in jobs:
+            state = ['running', 'cancelled'][job.cancelled()]
+            print '[%d] %s %ds: %s' % (job.number, state,
+                                       time.time() - job.started, job.name)
+
+
+class KillJob(Command):
+    def __init__(self, s, state, acc):
+        """__init__(self, string, AccountState, GmailAccount)
+
+        Differently than the standard __init__, it will take the string s into
+        account as the command's arguments."""
+        Command.__init__(self, s, state, acc)
+        self.arg = s.strip()
+
+    def execute(self):
         try:
-            self.acc.sendMessage(msg, replyTo=attrs.get('in-reply-to'))
-        except TypeError:
-            warn = """
-Warning: Wrong version of libgmail being used. I'll be able to send the e-mail
-         but not to keep it organized in a thread.
-"""
-            sys.stderr.write(warn)
-            self.acc.sendMessage(msg)
+            CommandFactory.jobs.kill(int(self.arg))
+        except ValueError:
+            raise ExecutionError("`kill' expects a job number as parameter")
+        except KeyError:
+            raise ExecutionError("Invalid job number")
+
+
+class SwitchAccount(Command):
+    def __init__(self, s, state, acc):
+        """__init__(self, string, AccountState, GmailAccount)
+
+        Differently than the standard __init__, it will take the string s into
+        account as the command's argument, the name or number of the account
+        to be used."""
+        Command.__init__(self, s, state, acc)
+        self.arg = s.strip()
+
+    def execute(self):
+        accounts = CommandFactory.accounts
+        if not self.arg:
+            for i, (name, acc) in enumerate(accounts):
+                if acc is self.acc:
+                    mark = '*'
+                else:
+                    mark = ' '
+                print '%s %d - %s (%s)' % (mark, i, name, acc.name)
+            return
+
+        acc = CommandFactory.find(self.arg)
+        if acc is None:
+            raise ExecutionError("There's no account `%s'" % self.arg)
+        CommandFactory.account = acc
+        CommandFactory.generate(LIST_EMAILS, acc).execute()
 
 
 class ComposeEmail(Command):
@@ -501,20 +1077,43 @@ class Help(Command):
     def execute(self):
         s = """Help:
 lf              - List folders
+lf -r           - List folders, asking gmail for the labels again
 lm              - List e-mails
+lm <start> [<count>] - List `count' e-mails starting at number `start'
+lm n            - List the next page of e-mails
 cd <num>|<name> - Go inside the folder indicated by `num'
                   (as shown by lf) or by the folder's name
 o <num>         - Open e-mail of the number `num' indicated
                   when `lm' was executed
+search <words>  - List the e-mails already seen with all the words,
+                  `o', `ar' and `!' then use its numbers
 wait <name1> <name2> ... - Keeps on waiting for the named folders
                            if new email arrives it executes a script
                            pointed out on .gmailreader/config and
-                           prints the folder contents on screen
+                           prints the folder contents on screen, the
+                           folders of other accounts are named like
+                           `<account>:<folder>'
+save <num>      - List the attachments of the thread `num'
+save <num> <att> [<file>] - Save the attachment `att' of the thread `num'
+                            to `file' (by default, in the current directory
+                            with the attachment's name)
 c               - Edit draft file
-s               - Send draft
-ar <num>        - Archive e-mail indicated by the number `num'
-! <num>         - Report e-mail indicated by the number `num' as spam
+s               - Send draft (it's queued and sent in the background)
+outbox          - List the e-mails not sent yet
+outbox -r       - Try to send them again now
+jobs            - List the commands running in the background
+kill <num>      - Stop the background command `num'
+stats           - Show how long the commands took, the requests they made
+                  and where the time went
+stats -c        - Forget what was measured so far
+ar <nums>       - Archive the e-mails indicated by the numbers `nums',
+                  which may have ranges, like `0-19,25,31'
+! <nums>        - Report the e-mails indicated by `nums' as spam
 help            - Prints this message
+<command> &     - Run lf, lm, ar, !, wait or search in the background,
+                  its output is shown when it's done
+acc             - List the accounts logged in
+acc <num>|<name> - Use the account indicated by `num' or by its name
 q               - Quit (c-d and c-c also work)"""
         print s
 
@@ -522,7 +1121,32 @@ q               - Quit (c-d and c-c also work)"""
 class CommandFactory:
     """Factory class used to generate new Commands and keep the execution state
     throught the AccountState class"""
-    accstate = AccountState()
+    jobs = Jobs()
+    # the accounts logged in, as (name, GmailAccount), and the one in use
+    accounts = []
+    account = None
+    # GmailAccount.name -> AccountState
+    states = {}
+
+    @classmethod
+    def state(cls, acc):
+        """state(GmailAccount) -> AccountState
+
+        Returns the state of the commands of the account."""
+        if acc.name not in cls.states:
+            cls.states[acc.name] = AccountState()
+        return cls.states[acc.name]
+
+    @classmethod
+    def find(cls, name):
+        """find(string) -> GmailAccount|None
+
+        Returns the account called name (or numbered name) by the acc
+        command."""
+        for i, (x, acc) in enumerate(cls.accounts):
+            if name in (x, str(i)):
+                return acc
+        return None
 
     @classmethod
     def generate(cls, s, acc):
@@ -531,49 +1155,168 @@ class CommandFactory:
         This method serves as a generator for an executable command"""
         tmp = s.split()
         cmdtype = tmp[0]
-        rest = ''.join(tmp[1:])
+        rest = ' '.join(tmp[1:])
+        state = cls.state(acc)
 
         if cmdtype == LIST_FOLDERS:
-            return ListFolders(rest, cls.accstate, acc)
+            command = ListFolders(rest, state, acc)
         elif cmdtype == LIST_EMAILS:
-            return ListEmails(rest, cls.accstate, acc)
+            command = ListEmails(rest, state, acc)
         elif cmdtype == ENTER_FOLDER:
-            return EnterFolder(rest, cls.accstate, acc)
+            command = EnterFolder(rest, state, acc)
         elif cmdtype == READ_EMAIL:
-            return ReadEmail(rest, cls.accstate, acc)
+            command = ReadEmail(rest, state, acc)
         elif cmdtype == COMPOSE:
-            return ComposeEmail(rest, cls.accstate, acc)
+            command = ComposeEmail(rest, state, acc)
         elif cmdtype == SEND_DRAFT:
-            return SendEmail(rest, cls.accstate, acc)
+            command = SendEmail(rest, state, acc)
         elif cmdtype == ARCHIVE:
-            return Archive(rest, cls.accstate, acc)
+            command = Archive(rest, state, acc)
         elif cmdtype == REPORT_SPAM:
-            return ReportSpam(rest, cls.accstate, acc)
+            command = ReportSpam(rest, state, acc)
         elif cmdtype == WAIT_EMAIL:
-            return WaitEmail(rest, cls.accstate, acc)
+            command = WaitEmail(rest, state, acc)
+        elif cmdtype == SEARCH:
+            command = Search(rest, state, acc)
+        elif cmdtype == OUTBOX:
+            command = ShowOutbox(rest, state, acc)
+        elif cmdtype == STATS:
+            command = ShowStats(rest, state, acc)
+        elif cmdtype == SAVE:
+            command = SaveAttachment(rest, state, acc)
+        elif cmdtype == JOBS:
+            command = ShowJobs(rest, state, acc)
+        elif cmdtype == KILL:
+            command = KillJob(rest, state, acc)
+        elif cmdtype == ACCOUNT:
+            command = SwitchAccount(rest, state, acc)
         elif cmdtype == HELP:
-            return Help(rest, cls.accstate, acc)
+            command = Help(rest, state, acc)
         elif cmdtype == QUIT:
             raise SystemExit
         else:
             raise NoCommandError()
 
+        # every run of the command is measured
+        execute = command.execute
+        command.execute = lambda: stats.run(cmdtype, execute)
+        return command
 
-def main():
+
+def _check_version():
     if libgmail.Version != '0.1.8-rafael4':
         warn = """
 Warning: Please use libgmail-0.1.8-rafael4. Without it you won't have access to
 all features. Look at gmailreader's web page for details.
 """
         sys.stderr.write(warn)
-    conf = Config(os.path.expanduser('~/.gmailreader/config'))
-    email = conf.get('username', lambda: raw_input("Username: "))
-    email += '@gmail.com'
-    pw = conf.get('password', lambda: getpass("Password: "))
 
+
+def _accounts():
+    """_accounts() -> [string|None]
+
+    Returns the config sections of the accounts to be used, None standing for
+    the options outside any section. Without sections there's just that
+    one."""
+    sections = conf.CONFIG.section_names()
+    if not sections or conf.CONFIG.has('username'):
+        return [None] + sections
+    return sections
+
+
+def _account_name(section, acc):
+    """_account_name(string|None, GmailAccount) -> string
+
+    Returns the name the account is known by in the acc and wait commands."""
+    if section is None:
+        return acc.name.split('@')[0]
+    return section
+
+
+def _socket(section):
+    """_socket(string|None) -> string
+
+    Returns the socket of the sync daemon serving the account."""
+    if section is None:
+        return conf.SOCKET
+    return '%s.%s' % (conf.SOCKET, section)
+
+
+def _daemon(section):
+    """_daemon(string|None) -> RemoteAccount|None
+
+    Returns the account served by the sync daemon of the section, if one is
+    running. sync isn't imported when there's no daemon's socket."""
+    if not os.path.exists(_socket(section)):
+        return None
+    return sync.connect(_socket(section))
+
+
+def _username(section=None):
+    """_username(string|None) -> string
+
+    Returns the e-mail address of the account, asking for the username if
+    it's not in the config file."""
+    if conf.CONFIG.has('username', section):
+        name = conf.CONFIG.get('username', section=section)
+    elif section is None:
+        name = raw_input("Username: ")
+    else:
+        name = raw_input("Username for %s: " % section)
+    return name + '@gmail.com'
+
+
+def _password(section=None):
+    """_password(string|None) -> string
+
+    Returns the password of the account, asking for it if it's not in the
+    config file."""
+    if conf.CONFIG.has('password', section):
+        return conf.CONFIG.get('password', section=section)
+    elif section is None:
+        return getpass("Password: ")
+    else:
+        return getpass("Password for %s: " % section)
+
+
+def _setup(acc):
+    """_setup(GmailAccount) -> None
+
+    Makes the requests of acc reuse their connections and be measured."""
+    if conf.KEEPALIVE > 0:
+        transport.install(acc, conf.THREADS, conf.KEEPALIVE)
+    stats.watch(acc)
+
+
+def _restore(email):
+    """_restore(string) -> (GmailAccount, [GmailThread])|None
+
+    Returns the account using the session cookies saved by its last login,
+    with the inbox listed to check them, or None if there are none or gmail
+    doesn't accept them anymore."""
+    try:
+        state = libgmail.GmailSessionState(filename=conf.SESSION % email)
+        acc = libgmail.GmailAccount(state=state)
+    except Exception:
+        # no session saved, an unreadable one or a libgmail without sessions
+        return None
+    _setup(acc)
+    try:
+        inbox = list(acc.getMessagesByFolder('inbox'))
+    except Exception:
+        return None
+    return (acc, inbox)
+
+
+def _login(email, pw):
+    """_login(string, string) -> GmailAccount
+
+    Logs in to gmail. The session cookies are saved, readable only by the
+    user, so the next runs don't need to log in again."""
     acc = libgmail.GmailAccount(email, pw)
+    _setup(acc)
 
-    print 'Please wait while logging in ...'
+    print 'Please wait while logging in to %s ...' % email
 
     try:
         acc.login()
@@ -581,14 +1324,118 @@ all features. Look at gmailreader's web page for details.
         print "Login failed: %s" % e.message
         raise SystemExit
 
+    fname = conf.SESSION % email
+    try:
+        os.close(os.open(fname, os.O_WRONLY | os.O_CREAT, 0600))
+        os.chmod(fname, 0600)
+        libgmail.GmailSessionState(account=acc).save(fname)
+    except (AttributeError, IOError, OSError):
+        pass
+
+    return acc
+
+
+def _connect(sections, daemons=True):
+    """_connect([string|None], bool) -> [(GmailAccount, [GmailThread]|None)]
+
+    Returns the accounts of the config sections passed, through their sync
+    daemons when there are some (and daemons is True). The others are
+    restored or logged in to all at the same time, after the missing
+    usernames and passwords are asked. Each account comes with its inbox if
+    it was listed to check a restored session."""
+    accs = {}
+    if daemons:
+        for section in sections:
+            acc = _daemon(section)
+            if acc:
+                accs[section] = (acc, None)
+    todo = [x for x in sections if x not in accs]
+    if not todo:
+        return [accs[x] for x in sections]
+
+    _check_version()
+    emails = dict([(x, _username(x)) for x in todo])
+    restored = pmap(lambda x: _restore(emails[x]), todo, len(todo))
+    for section, r in zip(todo, restored):
+        if r is not None:
+            accs[section] = r
+
+    todo = [x for x in todo if x not in accs]
+    passwords = dict([(x, _password(x)) for x in todo])
+    logged = pmap(lambda x: _login(emails[x], passwords[x]), todo, len(todo))
+    for section, acc in zip(todo, logged):
+        accs[section] = (acc, None)
+    return [accs[x] for x in sections]
+
+
+def _resume_outbox(acc):
+    """_resume_outbox(GmailAccount) -> None
+
+    Starts sending the e-mails left in the outbox by the last run."""
+    path = conf.OUTBOX % acc.name
+    # the lock file is left behind once the outbox is used
+    if os.path.isdir(path) and\
+       [x for x in os.listdir(path) if not x.startswith('.')]:
+        Command('', CommandFactory.state(acc), acc).outbox().start()
+
+
+def _serve(sections):
+    """_serve([string|None]) -> None
+
+    Runs the sync daemons of the accounts, each one in a thread of its own."""
+    running = [x for x in sections if _daemon(x)]
+    for section in running:
+        print 'The sync daemon of %s is already running' % _socket(section)
+    sections = [x for x in sections if x not in running]
+    if not sections:
+        raise SystemExit
+
+    servers = []
+    for section, (acc, inbox) in zip(sections, _connect(sections, False)):
+        server = sync.SyncServer(_socket(section), acc, ReadEmail.store,
+                                 conf.DAEMON_FOLDERS, conf.POLL_INTERVAL,
+                                 conf.THREADS, conf.POLL_MAX_INTERVAL)
+        print 'Serving %s on %s' % (acc.name, _socket(section))
+        _resume_outbox(acc)
+        t = threading.Thread(target=server.serve)
+        t.setDaemon(True)
+        t.start()
+        servers.append(t)
+    # the main thread only waits, so c-c still stops everything
+    while [t for t in servers if t.isAlive()]:
+        time.sleep(1)
+
+
+def main():
+    # readline only has to be imported to be used by raw_input
+    import readline
+
+    sections = _accounts()
+    if [x for x in sys.argv[1:] if x in ('-d', '--daemon')]:
+        _serve(sections)
+        return
+
+    connected = _connect(sections)
+    accs = [acc for (acc, inbox) in connected]
+    CommandFactory.accounts = [(_account_name(x, acc), acc)
+                               for x, acc in zip(sections, accs)]
+    CommandFactory.account = accs[0]
+    # the inbox listed to check the session is the one shown first, the
+    # others would be old by the time their accounts are used
+    CommandFactory.state(accs[0]).inbox = connected[0][1]
+    for acc in accs:
+        _resume_outbox(acc)
+
     # Start by printing the inbox contents
-    CommandFactory.generate(LIST_EMAILS, acc).execute()
+    CommandFactory.generate(LIST_EMAILS, CommandFactory.account).execute()
 
     while 1:
         try:
-            cmd = raw_input('gmail> ').strip()
+            cmd = CommandFactory.jobs.read('gmail> ').strip()
+            background = cmd.endswith('&')
+            cmd = cmd.rstrip('&').strip()
             if cmd:
-                command = CommandFactory.generate(cmd, acc)
+                command = CommandFactory.generate(cmd, CommandFactory.account)
             else:
                 continue
         except EOFError:
@@ -598,14 +1445,29 @@ all features. Look at gmailreader's web page for details.
             print "what?!"
             continue
 
+        if background or cmd.split()[0] in conf.BACKGROUND:
+            if command.background:
+                job = CommandFactory.jobs.start(cmd, command.execute,
+                                                (ExecutionError,
+                                                 sync.SyncError))
+                print '[%d] %s' % (job.number, cmd)
+                continue
+            elif background:
+                print "`%s' can't run in the background" % cmd.split()[0]
+                continue
+
         try:
             command.execute()
-        except ExecutionError, e:
+        except (ExecutionError, sync.SyncError), e:
             print "Error: ", e.message
 
 
 if __name__ == '__main__':
     try:
-        main()
-    except KeyboardInterrupt:
-        print
+        try:
+            main()
+        except KeyboardInterrupt:
+            print
+    finally:
+        # python mustn't exit from under a thread being rendered
+        Prefetcher.cancel_all(1)
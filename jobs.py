@@ -0,0 +1,269 @@
+"""Runs commands in the background while the user goes on typing."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import sys
+import time
+import thread
+import threading
+import traceback
+
+from cStringIO import StringIO
+
+def _readline():
+    # only imported when there's a job, gmailreader imports it in main()
+    try:
+        import readline
+        return readline
+    except ImportError:
+        return None
+
+
+class _Output:
+    """Stands for sys.stdout. What the threads of the jobs print goes to the
+    job's buffer, everything else goes to the real stdout."""
+
+    def __init__(self, out):
+        self.out = out
+        # thread id -> buffer
+        self.buffers = {}
+        self.softspace = 0
+
+    def __target(self):
+        return self.buffers.get(thread.get_ident(), self.out)
+
+    def write(self, s):
+        self.__target().write(s)
+
+    def flush(self):
+        if thread.get_ident() not in self.buffers:
+            self.out.flush()
+
+    def isatty(self):
+        # a job's output isn't shown as it's written, so it isn't paginated
+        return thread.get_ident() not in self.buffers and self.out.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.out, name)
+
+
+class Job:
+    """A command running in the background. Its output is kept until it's
+    finished. Cancelling it is up to the command, which should check
+    cancelled() whenever it can stop."""
+
+    def __init__(self, number, name):
+        self.number = number
+        self.name = name
+        self.output = StringIO()
+        self.cancel = threading.Event()
+        self.started = time.time()
+        self.status = 'running'
+        self.thread = None
+
+    def cancelled(self):
+        """cancelled(self) -> bool"""
+        return self.cancel.isSet()
+
+
+class Jobs:
+    """The jobs started by the user. When one of them finishes its output is
+    printed right away if the user is at the prompt, or before the next
+    prompt otherwise."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.count = 0
+        # by thread id
+        self.current = {}
+        self.done = []
+        self.prompt = None
+        self.output = None
+
+    def __install(self):
+        if self.output is None:
+            self.output = _Output(sys.stdout)
+            sys.stdout = self.output
+
+    def start(self, name, f, errors=()):
+        """start(self, string, f() -> None, (class)) -> Job
+
+        Runs f in the background as the job called name. The exceptions in
+        errors have their message printed, as the prompt does, any other one
+        is printed with its traceback."""
+        self.lock.acquire()
+        try:
+            self.__install()
+            self.count += 1
+            job = Job(self.count, name)
+            self.jobs[job.number] = job
+        finally:
+            self.lock.release()
+
+        def run():
+            ident = thread.get_ident()
+            self.lock.acquire()
+            try:
+                self.current[ident] = job
+                self.output.buffers[ident] = job.output
+            finally:
+                self.lock.release()
+            status = 'done'
+            try:
+                try:
+                    f()
+                except errors, e:
+                    print 'Error: ', e.message
+                    status = 'failed'
+                except:
+                    traceback.print_exc(file=job.output)
+                    status = 'failed'
+            finally:
+                self.lock.acquire()
+                try:
+                    del self.current[ident]
+                    del self.output.buffers[ident]
+                    if job.cancelled():
+                        status = 'cancelled'
+                    job.status = status
+                    del self.jobs[job.number]
+                    self.done.append(job)
+                finally:
+                    self.lock.release()
+                self.__notify()
+
+        job.thread = threading.Thread(target=run)
+        job.thread.setDaemon(True)
+        job.thread.start()
+        return job
+
+    def running(self):
+        """running(self) -> [Job]
+
+        Returns the jobs still running, oldest first."""
+        self.lock.acquire()
+        try:
+            jobs = self.jobs.values()
+        finally:
+            self.lock.release()
+        jobs.sort(key=lambda x: x.number)
+        return jobs
+
+    def kill(self, number):
+        """kill(self, int) -> None
+
+        Asks the job to stop. Raises KeyError if there's no such job."""
+        self.lock.acquire()
+        try:
+            self.jobs[number].cancel.set()
+        finally:
+            self.lock.release()
+
+    def cancelled(self):
+        """cancelled(self) -> bool
+
+        Returns whether the job of the calling thread, if any, was
+        cancelled."""
+        job = self.current.get(thread.get_ident())
+        return job is not None and job.cancelled()
+
+    def job(self):
+        """job(self) -> Job|None
+
+        Returns the job of the calling thread, None if it isn't a job."""
+        return self.current.get(thread.get_ident())
+
+    def __report(self):
+        """Returns what the jobs that finished printed, forgetting them."""
+        self.lock.acquire()
+        try:
+            done = self.done
+            self.done = []
+        finally:
+            self.lock.release()
+        text = []
+        for job in done:
+            text.append('[%d] %s: %s\n' % (job.number, job.status, job.name))
+            if job.status != 'cancelled':
+                text.append(job.output.getvalue())
+        return ''.join(text)
+
+    def __notify(self):
+        self.lock.acquire()
+        try:
+            prompt = self.prompt
+        finally:
+            self.lock.release()
+        if prompt is None:
+            return
+        text = self.__report()
+        if not text:
+            return
+        # the line being typed is written again below the output
+        line = ''
+        readline = _readline()
+        if readline is not None:
+            line = readline.get_line_buffer()
+        out = self.output.out
+        out.write('\n' + text + prompt + line)
+        out.flush()
+
+    def read(self, prompt):
+        """read(self, string) -> string
+
+        Reads a line like raw_input does, first printing the output of the
+        jobs that finished."""
+        sys.stdout.write(self.__report())
+        self.lock.acquire()
+        try:
+            self.prompt = prompt
+        finally:
+            self.lock.release()
+
+        # raw_input only uses readline when sys.stdout is a real file. It's
+        # given back to the jobs once readline starts reading.
+        readline = _readline()
+        swap = self.output is not None and readline is not None and\
+               sys.stdin.isatty() and self.output.out.isatty()
+        if swap:
+            sys.stdout = self.output.out
+            readline.set_startup_hook(self.__capture)
+        try:
+            return raw_input(prompt)
+        finally:
+            if swap:
+                readline.set_startup_hook(None)
+                sys.stdout = self.output
+            self.lock.acquire()
+            try:
+                self.prompt = None
+            finally:
+                self.lock.release()
+
+    def __capture(self):
+        sys.stdout = self.output
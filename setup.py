@@ -8,7 +8,11 @@ setup(name='gmailreader',
       author='Rafael C. Almeida',
       author_email='almeidaraf@gmail.com',
       url='http://www.nongnu.org/gmailreader/',
-      py_modules=['Config', 'configvars', 'MIMEParser', 'tabler'],
+      py_modules=['Config', 'configvars', 'fields', 'HTMLRenderer', 'jobs',
+                  'LabelCache', 'lazy', 'LRUCache', 'MIMEParser',
+                  'MessageStore', 'Outbox', 'Poller', 'Prefetcher',
+                  'SearchIndex', 'stats', 'sync', 'tabler', 'transport',
+                  'workers'],
       data_files=[('man/man1', ['gmailreader.1'])],
       scripts=['gmailreader.py']
      )
@@ -0,0 +1,251 @@
+"""Keeps how long the commands take and where the time goes."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import time
+import thread
+import threading
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Set to a directory, a profile of each command is written to it
+PROFILE = os.getenv('GMAILREADER_PROFILE')
+
+
+class Record:
+    """What was measured for one command, or for all the runs of a command:
+    how many times it ran, the seconds it took, the requests made to gmail
+    (or to the sync daemon), the bytes they received and the seconds spent
+    in each stage, like parsing e-mails."""
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.wall = 0.0
+        self.requests = 0
+        self.bytes = 0
+        self.stages = {}
+
+    def add(self, other):
+        """add(self, Record) -> None
+
+        Adds what was measured in other to this record."""
+        self.runs += other.runs
+        self.wall += other.wall
+        self.requests += other.requests
+        self.bytes += other.bytes
+        for stage, seconds in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+_lock = threading.Lock()
+# thread id -> the commands running in it, the inner ones last (wait runs lm,
+# for instance)
+_running = {}
+_totals = {}
+_last = None
+_count = 0
+
+
+def _update(f):
+    _lock.acquire()
+    try:
+        for record in _running.get(thread.get_ident(), ()):
+            f(record)
+    finally:
+        _lock.release()
+
+def current():
+    """current() -> [Record]
+
+    Returns the records of the commands running in the calling thread, to
+    be given to adopt() in the threads doing part of their work."""
+    _lock.acquire()
+    try:
+        return list(_running.get(thread.get_ident(), ()))
+    finally:
+        _lock.release()
+
+def adopt(records):
+    """adopt([Record]) -> None
+
+    Makes what is measured in the calling thread count for records, which
+    current() returned in another thread. adopt([]) makes it count for
+    nothing again."""
+    ident = thread.get_ident()
+    _lock.acquire()
+    try:
+        if records:
+            _running[ident] = list(records)
+        elif ident in _running:
+            del _running[ident]
+    finally:
+        _lock.release()
+
+def request(nbytes, seconds):
+    """request(int, float) -> None
+
+    Counts a request that received nbytes in the given seconds, for the
+    commands running in the calling thread. Those made by threads that
+    didn't adopt() a command, like the prefetchers, count for nothing."""
+    def add(record):
+        record.requests += 1
+        record.bytes += nbytes
+        record.stages['network'] = record.stages.get('network', 0.0) + seconds
+    _update(add)
+
+def stage(name, f, *args):
+    """stage(string, f(...) -> object, ...) -> object
+
+    Returns f(*args), adding the time it took to the stage name."""
+    start = time.time()
+    try:
+        return f(*args)
+    finally:
+        seconds = time.time() - start
+        def add(record):
+            record.stages[name] = record.stages.get(name, 0.0) + seconds
+        _update(add)
+
+def watch(acc):
+    """watch(GmailAccount) -> None
+
+    Makes the requests libgmail sends for acc be counted."""
+    retrieve = getattr(acc, '_retrievePage', None)
+    if retrieve is None:
+        return
+    def counted(*args, **kwargs):
+        start = time.time()
+        page = retrieve(*args, **kwargs)
+        try:
+            nbytes = len(page)
+        except TypeError:
+            nbytes = 0
+        request(nbytes, time.time() - start)
+        return page
+    acc._retrievePage = counted
+
+def _profile(name, f):
+    """Runs f writing its profile to PROFILE, along with where the memory
+    was allocated when tracemalloc is available."""
+    global _count
+    try:
+        import cProfile as profile
+    except ImportError:
+        import profile
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    _count += 1
+    prefix = os.path.join(PROFILE, '%d-%s-%d' % (os.getpid(), name, _count))
+    if tracemalloc:
+        tracemalloc.start()
+    p = profile.Profile()
+    try:
+        return p.runcall(f)
+    finally:
+        p.dump_stats(prefix + '.prof')
+        if tracemalloc:
+            tracemalloc.take_snapshot().dump(prefix + '.tracemalloc')
+            tracemalloc.stop()
+
+def run(name, f):
+    """run(string, f() -> object) -> object
+
+    Runs the command name, which is f, measuring it."""
+    global _last
+    record = Record(name)
+    record.runs = 1
+    ident = thread.get_ident()
+    _lock.acquire()
+    try:
+        _running.setdefault(ident, []).append(record)
+    finally:
+        _lock.release()
+
+    start = time.time()
+    try:
+        if PROFILE:
+            return _profile(name, f)
+        else:
+            return f()
+    finally:
+        record.wall = time.time() - start
+        _lock.acquire()
+        try:
+            _running[ident].remove(record)
+            if not _running[ident]:
+                del _running[ident]
+            if name not in _totals:
+                _totals[name] = Record(name)
+            _totals[name].add(record)
+            _last = record
+        finally:
+            _lock.release()
+
+def clear():
+    """clear() -> None
+
+    Forgets what was measured so far."""
+    global _last
+    _lock.acquire()
+    try:
+        _totals.clear()
+        _last = None
+    finally:
+        _lock.release()
+
+def peak_memory():
+    """peak_memory() -> int|None
+
+    Returns the most memory, in kilobytes, the process has used so far."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Mac OS X gives bytes instead of kilobytes
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak
+
+def report():
+    """report() -> (Record|None, [Record])
+
+    Returns the last command measured and the totals of each command."""
+    _lock.acquire()
+    try:
+        totals = _totals.values()
+        totals.sort(key=lambda x: -x.wall)
+        return (_last, totals)
+    finally:
+        _lock.release()
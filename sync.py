@@ -0,0 +1,426 @@
+"""Shares one logged in gmail account among several gmailreaders."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import time
+import errno
+import socket
+import threading
+import SocketServer
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import stats
+from lazy import LazyModule
+from Poller import Poller
+from workers import pmap
+
+# the gmailreaders using the daemon don't need libgmail
+libgmail = LazyModule('libgmail')
+urllib2 = LazyModule('urllib2')
+
+class SyncError(Exception):
+    """The sync daemon failed to do what was asked."""
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
+
+
+# The protocol is one json object per line, both ways. Strings go through
+# iso8859-1 so any sequence of bytes makes it to the other side unchanged.
+def _wire(obj):
+    if isinstance(obj, str):
+        return obj.decode('iso8859-1')
+    elif isinstance(obj, (list, tuple)):
+        return [_wire(x) for x in obj]
+    elif isinstance(obj, dict):
+        return dict([(_wire(k), _wire(v)) for k, v in obj.items()])
+    else:
+        return obj
+
+def _unwire(obj):
+    if isinstance(obj, unicode):
+        return obj.encode('iso8859-1')
+    elif isinstance(obj, list):
+        return [_unwire(x) for x in obj]
+    elif isinstance(obj, dict):
+        return dict([(_unwire(k), _unwire(v)) for k, v in obj.items()])
+    else:
+        return obj
+
+
+class _ThreadId:
+    """Stands for a thread the daemon hasn't seen, libgmail only needs the id
+    to archive or report it."""
+    def __init__(self, id):
+        self.id = id
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # just checking if the daemon is alive
+            return
+        try:
+            request = _unwire(json.loads(line))
+            op = getattr(self.server, 'op_' + request['op'])
+            response = {'ok': op(*request['args'])}
+        except urllib2.URLError, e:
+            response = {'error': ['URLError', str(e)]}
+        except SyncError, e:
+            response = {'error': ['SyncError', e.message]}
+        except Exception, e:
+            response = {'error': [e.__class__.__name__, str(e)]}
+        self.wfile.write(json.dumps(_wire(response)) + '\n')
+
+
+class SyncServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Serves a GmailAccount to the gmailreaders connecting to a unix socket.
+
+    The listings of the folders are kept for ``interval'' seconds, so several
+    gmailreaders waiting on the same folder cause just one request. The
+    folders in ``folders'' are refreshed in the background, as often as a
+    Poller finds them changing, and the e-mails of their unread threads are
+    downloaded to the message store before anybody asks for them. Only the
+    threads of the listings kept, and their messages, are remembered."""
+
+    daemon_threads = True
+
+    def __init__(self, path, acc, store, folders, interval, nthreads,
+                 maxinterval=None):
+        """__init__(self, string, GmailAccount, MessageStore, [string], float,
+                    int, float|None)
+
+        The folders are refreshed every interval seconds, up to every
+        maxinterval seconds while nothing happens in them."""
+        old = os.umask(0077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(old)
+        self.path = path
+        self.acc = acc
+        self.store = store
+        self.folders = folders
+        self.interval = interval
+        self.nthreads = nthreads
+        self.poller = Poller(self.__warm_listing, folders,
+                             (urllib2.URLError,), interval,
+                             maxinterval or interval, nthreads)
+        self.lock = threading.Lock()
+        # (folder, allPages) -> (time, [GmailThread])
+        self.listings = {}
+        # thread id -> GmailThread, for the threads in the listings
+        self.threads = {}
+        # thread id -> (state of the thread, [GmailMessage]) for the threads
+        # in the listings whose messages were asked for, and the messages by
+        # their own ids
+        self.expanded = {}
+        self.messages = {}
+
+    def __conversations(self, folder, allPages):
+        if folder in libgmail.STANDARD_FOLDERS:
+            threads = self.acc.getMessagesByFolder(folder, allPages)
+        else:
+            threads = self.acc.getMessagesByLabel(folder, allPages)
+        threads = list(threads)
+        self.lock.acquire()
+        try:
+            self.listings[(folder, allPages)] = (time.time(), threads)
+            self.__forget()
+        finally:
+            self.lock.release()
+        return threads
+
+    def __warm_listing(self, folder):
+        return self.__conversations(folder, False)
+
+    def __forget(self):
+        # called with the lock held, drops what isn't listed anymore
+        threads = {}
+        for (when, listing) in self.listings.values():
+            for t in listing:
+                threads[t.id] = t
+        self.threads = threads
+        for id in self.expanded.keys():
+            if id not in threads:
+                del self.expanded[id]
+        self.messages = {}
+        for (state, msgs) in self.expanded.values():
+            for m in msgs:
+                self.messages[m.id] = m
+
+    def __state(self, thread):
+        # a thread changes when it gets new messages, which makes it unread
+        # and usually changes its authors
+        return (bool(thread.unread), thread.authors, thread.subject)
+
+    def __expanded(self, thread):
+        """Returns whether the messages of the thread, as it was last
+        listed, are known."""
+        state = self.expanded.get(thread.id)
+        return state is not None and state[0] == self.__state(thread)
+
+    def __messages(self, thread):
+        self.lock.acquire()
+        try:
+            if self.__expanded(thread):
+                return self.expanded[thread.id][1]
+        finally:
+            self.lock.release()
+        msgs = list(thread)
+        self.lock.acquire()
+        try:
+            if thread.id in self.threads:
+                self.expanded[thread.id] = (self.__state(thread), msgs)
+                for m in msgs:
+                    self.messages[m.id] = m
+        finally:
+            self.lock.release()
+        return msgs
+
+    def __download(self, msg):
+        if msg.id not in self.store:
+            self.store.put(msg.id, msg.source)
+
+    def warm(self):
+        """warm(self) -> None
+
+        Refreshes the listings of the folders being kept warm that are due
+        and downloads the e-mails of their unread threads. Only the threads
+        that are new or changed since their messages were last listed are
+        asked for."""
+        self.poller.poll()
+        threads = []
+        for folder in self.folders:
+            listing = self.listings.get((folder, False))
+            if listing:
+                threads.extend([t for t in listing[1]
+                                if t.unread and not self.__expanded(t)])
+        msgs = []
+        for msglist in pmap(self.__messages, threads, self.nthreads):
+            msgs.extend(msglist)
+        pmap(self.__download, msgs, self.nthreads)
+
+    def __warmer(self):
+        while 1:
+            try:
+                self.warm()
+            except Exception, e:
+                sys.stderr.write('Unable to refresh folders: %s\n' % e)
+            time.sleep(max(self.poller.delay(), 1))
+
+    def serve(self):
+        """serve(self) -> None
+
+        Keeps the folders warm and answers the gmailreaders forever."""
+        t = threading.Thread(target=self.__warmer)
+        t.setDaemon(True)
+        t.start()
+        try:
+            self.serve_forever()
+        finally:
+            os.remove(self.path)
+
+    def op_name(self):
+        return self.acc.name
+
+    def op_labels(self):
+        return self.acc.getLabelNames()
+
+    def op_list(self, folder, allPages):
+        listing = self.listings.get((folder, allPages))
+        if listing and time.time() - listing[0] < self.interval:
+            threads = listing[1]
+        else:
+            threads = self.__conversations(folder, allPages)
+        return [(t.id, bool(t.unread), t.authors, t.subject) for t in threads]
+
+    def op_thread(self, id):
+        thread = self.threads.get(id)
+        if thread is None:
+            raise SyncError('Unknown thread %s, list its folder again' % id)
+        return [m.id for m in self.__messages(thread)]
+
+    def op_source(self, id):
+        source = self.store.get(id)
+        if source is None:
+            msg = self.messages.get(id)
+            if msg is None:
+                raise SyncError('Unknown message %s' % id)
+            source = msg.source
+            self.store.put(id, source)
+        return source
+
+    def __changed(self):
+        # the threads moved, the listings we have aren't right anymore, but
+        # their threads may still be opened until they're listed again
+        self.lock.acquire()
+        try:
+            for key, (when, threads) in self.listings.items():
+                self.listings[key] = (0, threads)
+        finally:
+            self.lock.release()
+
+    def op_archive(self, id):
+        self.acc.archiveThread(self.threads.get(id, _ThreadId(id)))
+        self.__changed()
+
+    def op_spam(self, id):
+        self.acc.reportSpam(self.threads.get(id, _ThreadId(id)))
+        self.__changed()
+
+    def op_send(self, to, subject, body, cc, bcc, replyTo):
+        msg = libgmail.GmailComposedMessage(to, subject, body, cc, bcc)
+        if replyTo:
+            self.acc.sendMessage(msg, replyTo=replyTo)
+        else:
+            self.acc.sendMessage(msg)
+        self.__changed()
+
+
+class RemoteMessage:
+    """A message of a RemoteThread. Its source is only downloaded from the
+    daemon when it's read."""
+    def __init__(self, acc, id):
+        self.acc = acc
+        self.id = id
+
+    def __getattr__(self, name):
+        if name != 'source':
+            raise AttributeError(name)
+        self.source = self.acc.call('source', self.id)
+        return self.source
+
+
+class RemoteThread:
+    """A thread listed by the daemon, it has the same attributes used from
+    libgmail's GmailThread."""
+    def __init__(self, acc, id, unread, authors, subject):
+        self.acc = acc
+        self.id = id
+        self.unread = unread
+        self.authors = authors
+        self.subject = subject
+
+    def __iter__(self):
+        return iter([RemoteMessage(self.acc, x)
+                     for x in self.acc.call('thread', self.id)])
+
+
+class RemoteAccount:
+    """Does what a GmailAccount does, as far as gmailreader is concerned,
+    through the sync daemon."""
+
+    def __init__(self, path):
+        """__init__(self, string)
+
+        path is the sync daemon's socket."""
+        self.path = path
+        self.name = self.call('name')
+
+    def call(self, op, *args):
+        """call(self, string, ...) -> object
+
+        Asks the daemon to run the operation op with the arguments passed.
+        It raises urllib2.URLError if either the daemon or gmail couldn't be
+        reached and SyncError if anything else went wrong."""
+        start = time.time()
+        try:
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.connect(self.path)
+            f = s.makefile('rwb')
+            s.close()
+            f.write(json.dumps(_wire({'op': op, 'args': args})) + '\n')
+            f.flush()
+            line = f.readline()
+            f.close()
+        except socket.error, e:
+            raise urllib2.URLError(e)
+        stats.request(len(line), time.time() - start)
+        if not line:
+            raise SyncError('The sync daemon closed the connection')
+        response = _unwire(json.loads(line))
+        if 'error' in response:
+            (kind, message) = response['error']
+            if kind == 'URLError':
+                raise urllib2.URLError(message)
+            raise SyncError(message)
+        return response['ok']
+
+    def getLabelNames(self):
+        return self.call('labels')
+
+    def __list(self, folder, allPages):
+        return [RemoteThread(self, *x)
+                for x in self.call('list', folder, allPages)]
+
+    def getMessagesByFolder(self, folder, allPages=False):
+        return self.__list(folder, allPages)
+
+    def getMessagesByLabel(self, label, allPages=False):
+        return self.__list(label, allPages)
+
+    def archiveThread(self, thread):
+        self.call('archive', thread.id)
+
+    def reportSpam(self, thread):
+        self.call('spam', thread.id)
+
+    def sendMessage(self, msg, replyTo=None):
+        self.call('send', msg.to, msg.subject, msg.body, msg.cc, msg.bcc,
+                  replyTo)
+
+
+def connect(path):
+    """connect(string) -> RemoteAccount|None
+
+    Returns the account served by the sync daemon listening on path, or None
+    if there's no daemon running."""
+    if not os.path.exists(path):
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except socket.error, e:
+        if e[0] == errno.ECONNREFUSED:
+            # the daemon went away without removing its socket
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return None
+    s.close()
+    return RemoteAccount(path)
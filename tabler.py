@@ -26,49 +26,80 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
-def _greatest_len(l):
-    return max(map(len, l))
+import os
+import sys
+import struct
 
-def _compose_field(lines):
-    x = _greatest_len(lines) + 1
-    fields = []
-    for line in lines:
-        fields.append(line+((x-len(line))*' '))
+def _terminal_height():
+    """_terminal_height() -> int|None
 
-    return fields
+    Returns how many lines fit on the terminal, or None if we aren't writing
+    to one."""
+    if not (sys.stdout.isatty() and sys.stdin.isatty()):
+        return None
+    try:
+        import fcntl
+        import termios
+        packed = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, 8*'\0')
+        height = struct.unpack('hhhh', packed)[0]
+    except (ImportError, IOError, AttributeError):
+        height = 0
+    if not height:
+        try:
+            height = int(os.getenv('LINES', ''))
+        except ValueError:
+            return None
+    return height
 
-def _concat(t1, t2):
-    t = []
-    for a, b in zip(t1,t2):
-        t.append(a+b)
-
-    return t
-
-def tabler(t):
-    """tabler([[string]]) -> [string]
+def tabler(t, widths=None):
+    """tabler([[string]], [int]|None) -> iter(string)
 
     Takes a list of lists of strings and format them in order to the user to be
-    able to print a table on the screen. Each string on the returned list is a
-    new entry"""
-    if not t:
-        return []
+    able to print a table on the screen. Each string generated is a new entry.
+    The last column goes on a line of its own, below the column before it.
 
-    table = []
-    table = _compose_field([x[0] for x in t])
-    table = _concat(table, _compose_field([x[1] for x in t]))
-    table = _concat(table, _compose_field([x[2] for x in t]))
+    The widths of the columns are measured in one pass over t before the first
+    entry is generated. If they're passed as parameter, t may be any iterable
+    and the entries are generated as the rows are read."""
+    if widths is None:
+        t = list(t)
+        if not t:
+            return
+        widths = [0] * len(t[0])
+        for row in t:
+            for i in xrange(len(row)):
+                widths[i] = max(widths[i], len(row[i]))
 
-    #XXX: this is a little too specific for our implementation, we might want to
-    #     make this more general.
-    indentsize = _greatest_len([x[0] for x in t]) +\
-                 _greatest_len([x[1] for x in t])
-    table = _concat(table, ['\n'+((2+indentsize)*' ')+x[3] for x in t])
+    # only the columns before the last one of the first line are padded,
+    # the ones left are at the end of their lines
+    padded = len(widths) - 2
+    indent = (sum(widths[:padded]) + padded) * ' '
+    for row in t:
+        first = [row[i] + (widths[i] + 1 - len(row[i])) * ' '
+                 for i in xrange(padded)]
+        first.append(row[padded])
+        yield ''.join(first).rstrip() + '\n' + (indent + row[-1]).rstrip()
 
-    # removing extra space by the end of the line
-    for i in xrange(len(table)):
-        result = []
-        for x in table[i].split('\n'):
-            result.append(x.rstrip())
-        table[i] = '\n'.join(result)
+def page(entries, height=None):
+    """page(iter(string), int|None) -> None
 
-    return table
+    Prints the entries passed as parameter, stopping each time the screen is
+    full until the user hits enter (or types q to skip the rest). By default
+    the height of the terminal is used, when not writing to a terminal every
+    entry is printed at once."""
+    if height is None:
+        height = _terminal_height()
+    lines = 0
+    for entry in entries:
+        n = entry.count('\n') + 1
+        if height and lines and lines + n >= height:
+            try:
+                answer = raw_input('-- more (q to stop) --')
+            except EOFError:
+                print
+                return
+            if answer.strip().lower() == 'q':
+                return
+            lines = 0
+        print entry
+        lines += n
@@ -0,0 +1,67 @@
+"""Checks that fix_field decodes the subject and author fields as gmail sends
+them like the old FieldParser did, except that entities are now decoded."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fields import fix_field
+
+# field -> what FieldParser, with the escapes and entities handling around it,
+# made of it
+BASELINE = {
+    'plain subject': 'plain subject',
+    'a < b and c > d': 'a < b and c > d',
+    'Jos\\u00e9 \\u00e7a va': 'Jos\xc3\xa9 \xc3\xa7a va',
+    '<b>bold</b> text': 'bold text',
+    '<span id="_upro_ann@example.com">Ann</span>': 'Ann <ann@example.com>',
+    '<span id="_upro_ann@example.com">Ann</span>, '
+    '<span id="_upro_me@gmail.com">me</span>':
+        'Ann <ann@example.com>, me <me@gmail.com>',
+}
+
+class FixFieldTest(unittest.TestCase):
+    def test_baseline(self):
+        for field, fixed in BASELINE.items():
+            self.assertEqual(fix_field(field), fixed)
+
+    def test_entities(self):
+        # FieldParser dropped them
+        self.assertEqual(fix_field('Tom &amp; Jerry &quot;live&quot;'),
+                         'Tom & Jerry "live"')
+        self.assertEqual(fix_field('R&eacute;sum&eacute; &#233; &#xe9;'),
+                         'R\xc3\xa9sum\xc3\xa9 \xc3\xa9 \xc3\xa9')
+        self.assertEqual(fix_field('&lt;draft&gt; &bogus;'),
+                         '<draft> &bogus;')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Checks the commands of gmailreader that don't need gmail."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import unittest
+
+# configvars creates its files as soon as it's imported
+HOME = tempfile.mkdtemp()
+os.environ['HOME'] = HOME
+atexit.register(shutil.rmtree, HOME, True)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gmailreader
+
+class NumbersTest(unittest.TestCase):
+    def test_numbers(self):
+        self.assertEqual(gmailreader._numbers('3'), [3])
+        self.assertEqual(gmailreader._numbers('0-3,7'), [0, 1, 2, 3, 7])
+        self.assertEqual(gmailreader._numbers('5 1-2, 9'), [5, 1, 2, 9])
+
+    def test_repeated(self):
+        self.assertEqual(gmailreader._numbers('2,0-3,2'), [2, 0, 1, 3])
+
+    def test_invalid(self):
+        for s in ['', ',', 'a', '1-b', '1,x', '3-1']:
+            self.assertRaises(ValueError, gmailreader._numbers, s)
+
+class Message:
+    def __init__(self, id, source):
+        self.id = id
+        self.source = source
+
+class SaveTest(unittest.TestCase):
+    SOURCE = """From: someone@example.com
+Subject: numbers
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="MIX"
+
+--MIX
+Content-Type: text/plain
+
+Attached.
+
+--MIX
+Content-Type: text/csv; name="n.csv"
+Content-Disposition: attachment; filename="n.csv"
+
+a,b
+--MIX
+Content-Type: application/octet-stream; name="x.bin"
+Content-Transfer-Encoding: base64
+
+AAEC
+--MIX--
+"""
+
+    def setUp(self):
+        self.state = gmailreader.AccountState()
+        self.state.active_threads = {0: [Message('m1', self.SOURCE)]}
+        self.dir = tempfile.mkdtemp(dir=HOME)
+
+    def save(self, n):
+        fname = os.path.join(self.dir, '%d.out' % n)
+        gmailreader.SaveAttachment('0 %d %s' % (n, fname), self.state,
+                                   None).execute()
+        return open(fname, 'rb').read()
+
+    def test_save(self):
+        self.assertEqual(self.save(0), 'a,b')
+        self.assertEqual(self.save(1), '\x00\x01\x02')
+
+    def test_invalid(self):
+        self.assertRaises(gmailreader.ExecutionError, self.save, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
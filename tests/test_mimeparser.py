@@ -0,0 +1,145 @@
+"""Checks that MIMEParser finds and saves the attachments whose bodies it keeps
+out of the parsed message."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import base64
+import unittest
+
+from cStringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import MIMEParser
+
+PDF = ''.join([chr(i % 256) for i in xrange(3000)])
+
+# a bounce, with the delivery status the parser reads as several messages,
+# then the e-mail returned, with its attachment
+BOUNCE = """From: MAILER-DAEMON <mailer-daemon@example.com>
+To: me@gmail.com
+Subject: Undelivered Mail Returned to Sender
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="RPT"
+
+--RPT
+Content-Type: text/plain
+
+The mail could not be delivered.
+
+--RPT
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.example.com
+
+Final-Recipient: rfc822; nobody@example.com
+Action: failed
+Status: 5.1.1
+
+Final-Recipient: rfc822; other@example.com
+Action: failed
+Status: 5.1.1
+
+--RPT
+Content-Type: message/rfc822
+
+From: me@gmail.com
+To: nobody@example.com
+Subject: report
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="ORIG"
+
+--ORIG
+Content-Type: text/plain
+
+See the report.
+
+--ORIG
+Content-Type: application/pdf; name="r.pdf"
+Content-Disposition: attachment; filename="r.pdf"
+Content-Transfer-Encoding: base64
+
+%s
+--ORIG--
+
+--RPT--
+""" % base64.encodestring(PDF)
+
+# text attachments are kept by the parser, they have no part number
+MIXED = """From: someone@example.com
+To: me@gmail.com
+Subject: numbers
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="MIX"
+
+--MIX
+Content-Type: text/plain
+
+Both attached.
+
+--MIX
+Content-Type: text/csv; name="n.csv"
+Content-Disposition: attachment; filename="n.csv"
+Content-Transfer-Encoding: quoted-printable
+
+a,b
+1,caf=C3=A9
+--MIX
+Content-Type: application/pdf; name="r.pdf"
+Content-Disposition: attachment; filename="r.pdf"
+Content-Transfer-Encoding: base64
+
+%s
+--MIX--
+""" % base64.encodestring(PDF)
+
+class AttachmentsTest(unittest.TestCase):
+    def test_bounce(self):
+        msg = MIMEParser.parse(BOUNCE)
+        found = MIMEParser.attachments(msg)
+        self.assertEqual([x.get_filename() for x in found], ['r.pdf'])
+        out = StringIO()
+        MIMEParser.save(BOUNCE, found[0], out)
+        self.assertEqual(out.getvalue(), PDF)
+
+    def test_text(self):
+        found = MIMEParser.attachments(MIMEParser.parse(MIXED))
+        self.assertEqual([x.get_filename() for x in found], ['n.csv', 'r.pdf'])
+        out = StringIO()
+        MIMEParser.save(MIXED, found[0], out)
+        self.assertEqual(out.getvalue(), 'a,b\n1,caf\xc3\xa9')
+        # parsing again gives the same attachments in the same order
+        again = MIMEParser.attachments(MIMEParser.parse(MIXED))
+        out = StringIO()
+        MIMEParser.save(MIXED, again[1], out)
+        self.assertEqual(out.getvalue(), PDF)
+
+
+if __name__ == '__main__':
+    unittest.main()
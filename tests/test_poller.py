@@ -0,0 +1,151 @@
+"""Checks how Poller schedules the folders and which threads it reports."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Poller
+
+class Clock:
+    """Stands for the time module, the time only moves when told to."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class Thread:
+    def __init__(self, id, unread):
+        self.id = id
+        self.unread = unread
+
+
+class FetchError(Exception):
+    pass
+
+
+class PollerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.real_time = Poller.time
+        Poller.time = self.clock
+        # folder -> [Thread] or an exception to be raised
+        self.folders = {'inbox': []}
+
+    def tearDown(self):
+        Poller.time = self.real_time
+
+    def fetch(self, folder):
+        threads = self.folders[folder]
+        if isinstance(threads, Exception):
+            raise threads
+        return threads
+
+    def poller(self):
+        return Poller.Poller(self.fetch, ['inbox'], (FetchError,), 10, 300)
+
+    def test_new_unread(self):
+        self.folders['inbox'] = [Thread('a', True), Thread('b', False)]
+        p = self.poller()
+        # what's unread at first isn't new
+        self.assertEqual(p.poll(), {})
+
+        self.folders['inbox'] = [Thread('a', True), Thread('b', True)]
+        self.clock.now += p.delay()
+        changed = p.poll()
+        self.assertEqual([t.id for t in changed['inbox']], ['b'])
+
+        # it stays unread, it isn't reported again
+        self.clock.now += p.delay()
+        self.assertEqual(p.poll(), {})
+
+    def test_interval_grows(self):
+        p = self.poller()
+        p.poll()
+        delays = []
+        for i in xrange(12):
+            delays.append(p.delay())
+            self.clock.now += p.delay()
+            p.poll()
+        self.assertEqual(delays[0], 15)
+        self.assertEqual(delays[1], 22.5)
+        self.assertEqual(delays[-1], 300)
+
+        # new e-mail makes it fast again
+        self.folders['inbox'] = [Thread('a', True)]
+        self.clock.now += p.delay()
+        self.assertEqual(p.poll().keys(), ['inbox'])
+        self.assertEqual(p.delay(), 10)
+
+    def test_backoff(self):
+        self.folders['inbox'] = FetchError()
+        p = self.poller()
+        delays = []
+        for i in xrange(7):
+            self.assertEqual(p.poll(), {})
+            delays.append(p.delay())
+            self.clock.now += p.delay()
+        self.assertEqual(delays, [20, 40, 80, 160, 300, 300, 300])
+
+        # one success and the failures are forgotten
+        self.folders['inbox'] = []
+        p.poll()
+        self.assertEqual(p.delay(), 15)
+        self.folders['inbox'] = FetchError()
+        self.clock.now += p.delay()
+        p.poll()
+        self.assertEqual(p.delay(), 20)
+
+    def test_other_errors(self):
+        self.folders['inbox'] = ValueError()
+        self.assertRaises(ValueError, self.poller().poll)
+
+    def test_due(self):
+        self.folders['other'] = []
+        p = Poller.Poller(self.fetch, ['inbox', 'other'], (FetchError,), 10,
+                          300)
+        p.poll()
+        fetched = []
+        def fetch(folder):
+            fetched.append(folder)
+            return []
+        p.fetch = fetch
+        # nothing is due yet
+        p.poll()
+        self.assertEqual(fetched, [])
+        self.clock.now += p.delay()
+        p.poll()
+        self.assertEqual(sorted(fetched), ['inbox', 'other'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Checks that gmailreader starts quickly: importing it stays within the budget
+of bench.py and doesn't import the modules only some commands need."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bench runs gmailreader with a HOME of its own
+import bench
+
+# imported by the commands that need them, never at startup
+LAZY = ['email', 'json', 'libgmail', 'select', 'socket', 'ssl', 'subprocess',
+        'sync', 'urllib', 'urllib2']
+
+class StartupTest(unittest.TestCase):
+    def test_budget(self):
+        elapsed = bench.startup()
+        self.failIf(elapsed > bench.STARTUP_BUDGET,
+                    'importing gmailreader took %.3fs, the budget is %.3fs' %
+                    (elapsed, bench.STARTUP_BUDGET))
+
+    def test_lazy_modules(self):
+        code = ('import sys, gmailreader\n'
+                'print " ".join([x for x in %r if sys.modules.get(x)])' % LAZY)
+        env = dict(os.environ)
+        env['PYTHONPATH'] = bench.SRC
+        p = subprocess.Popen([sys.executable, '-c', code], env=env,
+                             stdout=subprocess.PIPE)
+        imported = p.communicate()[0].split()
+        self.assertEqual(p.returncode, 0)
+        self.assertEqual(imported, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Checks which commands the requests made by each thread count for."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stats
+import workers
+
+class StatsTest(unittest.TestCase):
+    def setUp(self):
+        stats.clear()
+
+    def test_workers(self):
+        def f():
+            workers.pmap(lambda x: stats.request(x, 0.0), [1, 2, 3], 3)
+        stats.run('lm', f)
+        (last, totals) = stats.report()
+        self.assertEqual(last.requests, 3)
+        self.assertEqual(last.bytes, 6)
+
+    def test_other_threads(self):
+        started = threading.Event()
+        finish = threading.Event()
+        def other():
+            started.set()
+            finish.wait()
+            stats.request(100, 0.0)
+        def f():
+            t = threading.Thread(target=other)
+            t.start()
+            started.wait()
+            stats.request(1, 0.0)
+            finish.set()
+            t.join()
+        stats.run('lm', f)
+        (last, totals) = stats.report()
+        self.assertEqual(last.requests, 1)
+        self.assertEqual(last.bytes, 1)
+
+    def test_nested(self):
+        def inner():
+            stats.request(1, 0.0)
+        def outer():
+            stats.run('lm', inner)
+            stats.request(2, 0.0)
+        stats.run('wait', outer)
+        (last, totals) = stats.report()
+        bytes = dict([(x.name, x.bytes) for x in totals])
+        self.assertEqual(bytes, {'lm': 1, 'wait': 3})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Checks the connections the keep-alive handlers make and use again."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import sys
+import socket
+import httplib
+import unittest
+import urllib2
+
+from cStringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transport
+
+class Response:
+    status = 200
+    reason = 'OK'
+    will_close = False
+
+    def __init__(self):
+        self.msg = httplib.HTTPMessage(StringIO(''))
+
+    def read(self):
+        return 'body'
+
+class Connection:
+    """Stands for HTTPSConnection, it remembers what was asked of it."""
+    made = []
+
+    def __init__(self, host):
+        self.host = host
+        self.tunnel = None
+        self.tunnel_headers = None
+        self.requests = []
+        # the server never closes it
+        (self.sock, self.peer) = socket.socketpair()
+        Connection.made.append(self)
+
+    def set_tunnel(self, host, headers=None):
+        self.tunnel = host
+        self.tunnel_headers = headers
+
+    def request(self, method, selector, data, headers):
+        self.requests.append((method, selector, headers))
+
+    def getresponse(self):
+        return Response()
+
+    def close(self):
+        self.sock.close()
+        self.peer.close()
+
+class Opener:
+    addheaders = []
+
+class KeepAliveTest(unittest.TestCase):
+    def setUp(self):
+        Connection.made = []
+        self.handler = transport._KeepAliveMixin(transport.ConnectionPool())
+        self.handler.parent = Opener()
+
+    def open(self, url, proxy=None):
+        req = urllib2.Request(url)
+        if proxy:
+            # as the opener and ProxyHandler do
+            req.get_host()
+            req.set_proxy(proxy, 'https')
+            req.add_header('Proxy-authorization', 'Basic eDp5')
+        return self.handler._open('https', Connection, req)
+
+    def test_direct(self):
+        self.assertEqual(self.open('https://mail.google.com/mail').read(),
+                         'body')
+        self.assertEqual(len(Connection.made), 1)
+        conn = Connection.made[0]
+        self.assertEqual(conn.host, 'mail.google.com')
+        self.assertEqual(conn.tunnel, None)
+
+    def test_proxy(self):
+        if not hasattr(urllib2.Request('https://x/'), '_tunnel_host'):
+            return
+        self.open('https://mail.google.com/mail', 'proxy:3128')
+        conn = Connection.made[0]
+        self.assertEqual(conn.host, 'proxy:3128')
+        self.assertEqual(conn.tunnel, 'mail.google.com')
+        self.assertEqual(conn.tunnel_headers,
+                         {'Proxy-authorization': 'Basic eDp5'})
+        (method, selector, headers) = conn.requests[0]
+        self.assertEqual(selector, '/mail')
+        self.assert_('Proxy-authorization' not in headers)
+
+    def test_reused_by_tunnel(self):
+        if not hasattr(urllib2.Request('https://x/'), '_tunnel_host'):
+            return
+        self.open('https://mail.google.com/mail', 'proxy:3128')
+        self.open('https://www.google.com/accounts', 'proxy:3128')
+        self.open('https://mail.google.com/mail?x', 'proxy:3128')
+        self.assertEqual([x.tunnel for x in Connection.made],
+                         ['mail.google.com', 'www.google.com'])
+        self.assertEqual(len(Connection.made[0].requests), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,252 @@
+"""urllib2 handlers that keep the connections to gmail open between requests."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import time
+import gzip
+import socket
+import select
+import urllib
+import urllib2
+import httplib
+import threading
+
+from cStringIO import StringIO
+
+
+def _dropped(conn):
+    """_dropped(HTTPConnection) -> bool
+
+    Returns whether an idle connection was closed by the server: there's
+    nothing it could be sending, so anything to read means it's gone."""
+    if conn.sock is None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (select.error, socket.error, ValueError):
+        return True
+
+
+class ConnectionPool:
+    """The connections kept open, by host and, through a proxy, by the host
+    tunneled to. Up to limit connections are made to each host, when all of
+    them are busy the next request waits for one. The ones not used for
+    timeout seconds are closed."""
+
+    def __init__(self, limit=4, timeout=60):
+        """__init__(self, int, float)"""
+        self.limit = max(1, limit)
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        # (scheme, host, tunnel host) -> [(connection, when it was last used)]
+        self.idle = {}
+        # (scheme, host, tunnel host) -> how many connections are open
+        self.open = {}
+
+    def get(self, key, make):
+        """get(self, (string, string, string|None), f() -> HTTPConnection)
+        -> (HTTPConnection, bool)
+
+        Returns a connection to the host and whether it was used before. A
+        new one is made by make when none is idle."""
+        self.cond.acquire()
+        try:
+            while 1:
+                idle = self.idle.get(key, [])
+                while idle:
+                    (conn, when) = idle.pop()
+                    if time.time() - when < self.timeout and\
+                       not _dropped(conn):
+                        return (conn, True)
+                    conn.close()
+                    self.open[key] -= 1
+                if self.open.get(key, 0) < self.limit:
+                    self.open[key] = self.open.get(key, 0) + 1
+                    break
+                self.cond.wait()
+        finally:
+            self.cond.release()
+        return (make(), False)
+
+    def put(self, key, conn):
+        """put(self, (string, string, string|None), HTTPConnection) -> None
+
+        Gives back a connection that may be used again."""
+        self.cond.acquire()
+        try:
+            self.idle.setdefault(key, []).append((conn, time.time()))
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+    def discard(self, key, conn):
+        """discard(self, (string, string, string|None), HTTPConnection)
+        -> None
+
+        Closes a connection that can't be used again."""
+        conn.close()
+        self.cond.acquire()
+        try:
+            self.open[key] -= 1
+            self.cond.notify()
+        finally:
+            self.cond.release()
+
+
+class _KeepAliveMixin:
+    """What's common to the http and https handlers. The responses are read
+    at once, so the connection can be used again before the caller is done
+    with them, and they're asked and given back compressed with gzip."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _open(self, scheme, connection, req):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+        # https through a proxy: host is the proxy, which is asked to
+        # connect to the tunnel host (python 2.4 and 2.5 don't know of them)
+        tunnel = getattr(req, '_tunnel_host', None)
+        key = (scheme, host, tunnel)
+
+        headers = dict(self.parent.addheaders)
+        headers.update(req.headers)
+        headers.update(req.unredirected_hdrs)
+        headers['Connection'] = 'keep-alive'
+        headers['Accept-Encoding'] = 'gzip'
+        if req.has_data() and 'Content-type' not in headers:
+            headers['Content-type'] = 'application/x-www-form-urlencoded'
+        method = req.get_method()
+
+        tunnel_headers = {}
+        for name in headers.keys():
+            # it's for the proxy, the host at the other end mustn't see it
+            if tunnel and name.lower() == 'proxy-authorization':
+                tunnel_headers[name] = headers.pop(name)
+        def make():
+            conn = connection(host)
+            if tunnel and hasattr(conn, 'set_tunnel'):
+                conn.set_tunnel(tunnel, headers=tunnel_headers)
+            elif tunnel:
+                # python 2.6 can't send the proxy its headers
+                conn._set_tunnel(tunnel)
+            return conn
+
+        (conn, reused) = self.pool.get(key, make)
+        try:
+            sent = False
+            try:
+                conn.request(method, req.get_selector(), req.get_data(),
+                             headers)
+                sent = True
+                r = conn.getresponse()
+            except (socket.error, httplib.HTTPException):
+                # the server may have closed it while it was idle, but a
+                # request with a body that was sent may also have been
+                # handled, and must not be made twice
+                if not reused or (sent and req.has_data()):
+                    raise
+                self.pool.discard(key, conn)
+                (conn, reused) = self.pool.get(key, make)
+                r = self.__request(conn, method, req, headers)
+            body = r.read()
+        except (socket.error, httplib.HTTPException), e:
+            self.pool.discard(key, conn)
+            raise urllib2.URLError(e)
+        except:
+            self.pool.discard(key, conn)
+            raise
+
+        if r.will_close:
+            self.pool.discard(key, conn)
+        else:
+            self.pool.put(key, conn)
+
+        msg = r.msg
+        if msg.get('content-encoding', '').lower() == 'gzip':
+            try:
+                body = gzip.GzipFile(fileobj=StringIO(body)).read()
+            except (IOError, EOFError), e:
+                raise urllib2.URLError(e)
+            del msg['content-encoding']
+            del msg['content-length']
+            msg['Content-length'] = str(len(body))
+
+        resp = urllib.addinfourl(StringIO(body), msg, req.get_full_url())
+        resp.code = r.status
+        resp.msg = r.reason
+        return resp
+
+    def __request(self, conn, method, req, headers):
+        conn.request(method, req.get_selector(), req.get_data(), headers)
+        return conn.getresponse()
+
+
+class KeepAliveHTTPHandler(_KeepAliveMixin, urllib2.HTTPHandler):
+    def __init__(self, pool):
+        urllib2.HTTPHandler.__init__(self)
+        _KeepAliveMixin.__init__(self, pool)
+
+    def http_open(self, req):
+        return self._open('http', httplib.HTTPConnection, req)
+
+
+# python may have been built without ssl
+if hasattr(urllib2, 'HTTPSHandler'):
+    class KeepAliveHTTPSHandler(_KeepAliveMixin, urllib2.HTTPSHandler):
+        def __init__(self, pool):
+            urllib2.HTTPSHandler.__init__(self)
+            _KeepAliveMixin.__init__(self, pool)
+
+        def https_open(self, req):
+            return self._open('https', httplib.HTTPSConnection, req)
+else:
+    KeepAliveHTTPSHandler = None
+
+
+def install(acc, limit=4, timeout=60):
+    """install(GmailAccount, int, float) -> None
+
+    Makes the requests of acc go through connections kept open, up to limit
+    of them to each host, each closed after timeout idle seconds. The other
+    handlers of libgmail's opener, like the one that keeps the cookies on
+    redirects, are kept."""
+    opener = getattr(acc, 'opener', None)
+    if opener is None:
+        return
+    pool = ConnectionPool(limit, timeout)
+    ours = [KeepAliveHTTPHandler(pool)]
+    replaced = (urllib2.HTTPHandler,)
+    if KeepAliveHTTPSHandler is not None:
+        ours.append(KeepAliveHTTPSHandler(pool))
+        replaced = (urllib2.HTTPHandler, urllib2.HTTPSHandler)
+    handlers = [x for x in opener.handlers if not isinstance(x, replaced)]
+    acc.opener = urllib2.build_opener(*(ours + handlers))
+    acc.opener.addheaders = opener.addheaders
+    # libgmail installs its opener too
+    urllib2.install_opener(acc.opener)
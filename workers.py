@@ -0,0 +1,106 @@
+"""Helpers for running blocking calls, like network requests, in parallel."""
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2008
+#       Rafael Cunha de Almeida <almeidaraf@gmail.com>. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#    3. The name of the author may not be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER
+# IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+import sys
+import threading
+
+import stats
+
+def _run(f, items, nthreads):
+    """_run(f(x) -> y, [x], int) -> ([y], [exc_info|None])
+
+    Calls f for each item, up to nthreads at the same time, returning the
+    results and the exceptions raised, both in the order of items."""
+    results = [None] * len(items)
+    errors = [None] * len(items)
+
+    if nthreads <= 1 or len(items) <= 1:
+        for i, x in enumerate(items):
+            try:
+                results[i] = f(x)
+            except:
+                errors[i] = sys.exc_info()
+        return (results, errors)
+
+    # the list is shared by the workers, each pop() hands out one item
+    pending = list(reversed(range(len(items))))
+    lock = threading.Lock()
+    # what the workers do is part of the caller's command
+    records = stats.current()
+
+    def worker():
+        stats.adopt(records)
+        try:
+            while 1:
+                lock.acquire()
+                try:
+                    if not pending:
+                        return
+                    i = pending.pop()
+                finally:
+                    lock.release()
+                try:
+                    results[i] = f(items[i])
+                except:
+                    errors[i] = sys.exc_info()
+        finally:
+            stats.adopt([])
+
+    threads = [threading.Thread(target=worker)
+               for x in xrange(min(nthreads, len(items)))]
+    for t in threads:
+        t.setDaemon(True)
+        t.start()
+    for t in threads:
+        t.join()
+    return (results, errors)
+
+def pmap(f, items, nthreads):
+    """pmap(f(x) -> y, [x], int) -> [y]
+
+    Works just like map(f, items), but up to nthreads calls of f run at the
+    same time. The results keep the order of items. If any call raises an
+    exception, the one raised for the first item is raised again once all the
+    calls are finished."""
+    (results, errors) = _run(f, list(items), nthreads)
+    for e in errors:
+        if e:
+            raise e[0], e[1], e[2]
+    return results
+
+def pmap_each(f, items, nthreads):
+    """pmap_each(f(x) -> y, [x], int) -> [(y, None)|(None, Exception)]
+
+    Like pmap, but one failed call doesn't hide the results of the others:
+    each item gets its result or the exception its call raised."""
+    (results, errors) = _run(f, list(items), nthreads)
+    for e in errors:
+        # being interrupted isn't the failure of one item
+        if e and issubclass(e[0], (KeyboardInterrupt, SystemExit)):
+            raise e[0], e[1], e[2]
+    return [(r, e and e[1]) for r, e in zip(results, errors)]